@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src import parser  # noqa: E402
+
+# saved pages are matched by file name prefix, e.g. sakura-list-0.html
+cases = {
+    "nogi-list": ("img", parser.strainer("img")),
+    "sakura-list": (".com-blog-part li.box", parser.strainer(class_="com-blog-part")),
+    "sakura-article": (
+        "div.box-article img",
+        parser.strainer("div", class_="box-article"),
+    ),
+    "hinata-list": (".p-blog-article", parser.strainer(class_="p-blog-article")),
+}
+
+
+def load_pages(directory: str) -> dict[str, list[str]]:
+    pages: dict[str, list[str]] = {kind: [] for kind in cases}
+    for name in sorted(os.listdir(directory)):
+        kind = next((k for k in cases if name.startswith(k)), None)
+        if kind is None:
+            continue
+
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            text = f.read()
+
+        if kind == "nogi-list":
+            data = json.loads(text.strip().strip("res(").rstrip(");"))
+            pages[kind].extend(article["text"] for article in data["data"])
+        else:
+            pages[kind].append(text)
+
+    return pages
+
+
+def measure(pages: list[str], select: str, backend: str, only, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        for page in pages:
+            soup = BeautifulSoup(page, backend, parse_only=only)
+            soup.select(select)
+            soup.decompose()
+    end = time.process_time()
+
+    return (end - start) / (repeat * len(pages)) * 1000
+
+
+def main() -> None:
+    argparser = ArgumentParser()
+    argparser.add_argument("directory", help="directory of saved pages")
+    argparser.add_argument("-r", "--repeat", type=int, default=20)
+    args = argparser.parse_args()
+
+    pages = load_pages(args.directory)
+    backend = parser.detect_backend()
+
+    print(
+        f"{'page':<16}{'count':>6}{'html.parser':>14}{backend + '+strainer':>20}{'speedup':>10}"
+    )
+    for kind, (select, only) in cases.items():
+        if not pages[kind]:
+            continue
+
+        baseline = measure(pages[kind], select, "html.parser", None, args.repeat)
+        fast = measure(pages[kind], select, backend, only, args.repeat)
+        print(
+            f"{kind:<16}{len(pages[kind]):>6}{baseline:>12.2f}ms{fast:>18.2f}ms"
+            f"{baseline / fast:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import asyncio
+import sys
+import time
+from argparse import ArgumentParser
+
+
+class Store:
+    def __init__(self) -> None:
+        self.values: dict[bytes, bytes] = {}
+        self.expires: dict[bytes, float] = {}
+
+    def get(self, key: bytes) -> bytes | None:
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+
+        return self.values.get(key)
+
+    def set(self, key: bytes, value: bytes, options: list[bytes]) -> bool:
+        options = [o.upper() for o in options]
+        exists = self.get(key) is not None
+        if b"NX" in options and exists or b"XX" in options and not exists:
+            return False
+
+        self.values[key] = value
+        self.expires.pop(key, None)
+        for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+            if unit in options:
+                ttl = float(options[options.index(unit) + 1]) * scale
+                self.expires[key] = time.monotonic() + ttl
+
+        return True
+
+    def delete(self, keys: list[bytes]) -> int:
+        count = 0
+        for key in keys:
+            if self.get(key) is not None:
+                del self.values[key]
+                self.expires.pop(key, None)
+                count += 1
+
+        return count
+
+    def command(self, args: list[bytes], proto: int) -> bytes:
+        name = args[0].upper()
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"GET":
+            return bulk(self.get(args[1]), proto)
+        if name == b"SET":
+            if self.set(args[1], args[2], args[3:]):
+                return b"+OK\r\n"
+            return bulk(None, proto)
+        if name == b"DEL":
+            return b":%d\r\n" % self.delete(args[1:])
+        if name in (b"CLIENT", b"SELECT"):
+            return b"+OK\r\n"
+
+        return b"-ERR unknown command '%s'\r\n" % name
+
+
+def bulk(value: bytes | None, proto: int = 2) -> bytes:
+    if value is None:
+        return b"_\r\n" if proto == 3 else b"$-1\r\n"
+
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def hello(proto: int) -> bytes:
+    fields = bulk(b"server") + bulk(b"redis") + bulk(b"proto") + b":%d\r\n" % proto
+    if proto == 3:
+        return b"%2\r\n" + fields
+
+    return b"*4\r\n" + fields
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[bytes]:
+    header = await reader.readline()
+    if not header.startswith(b"*"):
+        # inline commands, as typed into telnet
+        return header.split()
+
+    args = []
+    for _ in range(int(header[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+
+    return args
+
+
+async def serve(store: Store, host: str, port: int) -> None:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # redis-py greets with HELLO 3 and then expects RESP3 nulls
+            proto = 2
+            while args := await read_command(reader):
+                if args[0].upper() == b"HELLO":
+                    proto = int(args[1]) if len(args) > 1 else proto
+                    writer.write(hello(proto))
+                else:
+                    writer.write(store.command(args, proto))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f"redis://{host}:{port}/0", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    argparser = ArgumentParser(
+        description="in-memory stand-in for the Redis commands the work store uses"
+    )
+    argparser.add_argument("--host", default="127.0.0.1")
+    argparser.add_argument("--port", type=int, default=6379)
+    args = argparser.parse_args()
+
+    try:
+        asyncio.run(serve(Store(), args.host, args.port))
+    except KeyboardInterrupt:
+        print("stopped", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import httpx
+
+from server import add_fixture_options, fixture_argv
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class LatencyHooks:
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        self.status: dict[int, int] = {}
+
+    async def on_request(self, request: httpx.Request) -> None:
+        request.extensions["bench_start"] = time.perf_counter()
+
+    async def on_response(self, response: httpx.Response) -> None:
+        start = response.request.extensions.get("bench_start")
+        if start is not None:
+            self.latencies.append(time.perf_counter() - start)
+        self.status[response.status_code] = self.status.get(response.status_code, 0) + 1
+
+    def options(self) -> dict:
+        return {
+            "event_hooks": {
+                "request": [self.on_request],
+                "response": [self.on_response],
+            }
+        }
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def start_server(argv: list[str]) -> tuple[subprocess.Popen, str]:
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "server.py"), *argv],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    url = server.stdout.readline().strip()
+    return server, url
+
+
+def load_crawler(argv: list[str]):
+    sys.argv = ["sakamichi-blog-crawler.py", *argv]
+    sys.path.insert(0, root_dir)
+    spec = importlib.util.spec_from_file_location(
+        "crawler_main", os.path.join(root_dir, "sakamichi-blog-crawler.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def point_to(url: str) -> None:
+    from src.crawler import hinata, nogi, sakura
+
+    nogi.base_url = url + "/nogi"
+    sakura.base_url = url + "/sakura"
+    hinata.base_url = url + "/hinata/s/official/"
+
+
+def count_files(path: str) -> int:
+    return sum(len(files) for _, _, files in os.walk(path))
+
+
+def main() -> None:
+    argparser = ArgumentParser(
+        description="run the crawler against a local replay server",
+        epilog="arguments after -- are passed to the crawler",
+    )
+    argparser.add_argument("--workdir", type=str, default=None)
+    argparser.add_argument(
+        "--runs", type=int, default=1, help="crawl N times in the same workdir"
+    )
+    argparser.add_argument(
+        "--json", type=str, default=None, help="write the report to a file"
+    )
+    argparser.add_argument(
+        "--quiet", action="store_true", help="suppress crawler INFO logs"
+    )
+    add_fixture_options(argparser)
+
+    argv = sys.argv[1:]
+    crawler_argv = []
+    if "--" in argv:
+        crawler_argv = argv[argv.index("--") + 1 :]
+        argv = argv[: argv.index("--")]
+    args = argparser.parse_args(argv)
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    server, url = start_server(fixture_argv(args))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sakamichi-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    try:
+        crawler = load_crawler(["--default_rate", "1000", *crawler_argv])
+        point_to(url)
+        if args.quiet:
+            logging.disable(logging.INFO)
+
+        reports = []
+        for run in range(args.runs):
+            hooks = LatencyHooks()
+            files_before = count_files("data")
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+
+            crawler_args = crawler.get_option()
+            crawler.setup(crawler_args)
+            asyncio.run(crawler.async_run(**hooks.options()))
+            crawler.teardown()
+
+            wall = time.perf_counter() - start
+            self_usage = resource.getrusage(resource.RUSAGE_SELF)
+            child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            images = count_files("data") - files_before
+
+            reports.append(
+                {
+                    "run": run,
+                    "wall seconds": round(wall, 3),
+                    "cpu seconds": round(time.process_time() - cpu_start, 3),
+                    "parse worker cpu seconds": round(
+                        child_usage.ru_utime + child_usage.ru_stime, 3
+                    ),
+                    "images": images,
+                    "images/sec": round(images / wall, 2),
+                    "requests": len(hooks.latencies),
+                    "requests/sec": round(len(hooks.latencies) / wall, 2),
+                    "status": hooks.status,
+                    "p50 latency ms": round(percentile(hooks.latencies, 50) * 1000, 2),
+                    "p99 latency ms": round(percentile(hooks.latencies, 99) * 1000, 2),
+                    "peak rss MiB": round(self_usage.ru_maxrss / 1024, 1),
+                }
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {
+        "workdir": workdir,
+        "options": vars(args),
+        "crawler args": crawler_argv,
+        "runs": reports,
+    }
+    for r in reports:
+        print(json.dumps(r, ensure_ascii=False))
+    if json_path:
+        with open(json_path, mode="w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+kana = ["あ", "い", "う", "え", "お", "か", "き", "く", "け", "こ", "さ", "し"]
+
+jpeg_head = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+jpeg_tail = b"\xff\xd9"
+
+
+@dataclass
+class Fixture:
+    members: int = 5
+    posts: int = 30
+    images: int = 3
+    image_size: int = 64 * 1024
+    page_size: int = 10
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    truncate_rate: float = 0.0
+    chrome: int = 200
+    seed: int = 0
+    pages: str = ""
+
+    def __post_init__(self) -> None:
+        self.now = datetime(2024, 1, 1, 12, 0, 0)
+        self.image = (
+            jpeg_head
+            + bytes(max(0, self.image_size - len(jpeg_head) - len(jpeg_tail)))
+            + jpeg_tail
+        )
+
+    def codes(self) -> list[str]:
+        return [str(100 + i) for i in range(self.members)]
+
+    def post_date(self, code: str, no: int) -> datetime:
+        return self.now - timedelta(hours=no * 7 + int(code) % 7)
+
+    def image_urls(self, host: str, group: str, code: str, no: int) -> list[str]:
+        return [f"{host}/img/{group}/{code}/{no}/{i}.jpg" for i in range(self.images)]
+
+    def name(self, index: int) -> tuple[str, str]:
+        first = kana[index % len(kana)] + kana[(index // len(kana)) % len(kana)]
+        last = kana[(index * 7 + 3) % len(kana)]
+        return last + " " + first, f"Member{index} Bench"
+
+    def article_html(self, host: str, group: str, code: str, no: int) -> str:
+        imgs = "".join(
+            f'<p><img src="{url}"></p>'
+            for url in self.image_urls(host, group, code, no)
+        )
+        return f"<div><p>post {no}</p>{imgs}</div>"
+
+
+# saved pages are matched by file name prefix as in parse_bench.py; every
+# member of a group is served the same pages, in file name order
+saved_kinds = ["nogi-list", "sakura-list", "sakura-article", "hinata-list"]
+empty_pages = {
+    "nogi-list": b'res({"data": []});',
+    "sakura-list": b"<html><body></body></html>",
+    "hinata-list": b"<html><body></body></html>",
+}
+img_src = re.compile(r'(<img\b[^>]*?\bsrc=")(?:https?://[^/"]+)?/?')
+
+
+def load_saved(directory: str, url: str) -> dict[str, list[bytes]]:
+    saved: dict[str, list[bytes]] = {}
+    for name in sorted(os.listdir(directory)):
+        kind = next((k for k in saved_kinds if name.startswith(k)), None)
+        if kind is None:
+            continue
+
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            text = f.read()
+
+        # images point back at this server instead of the real site
+        img = rf"\g<1>{url}/img/{kind.split('-')[0]}/"
+        if kind == "nogi-list":
+            data = json.loads(text.strip().strip("res(").rstrip(");"))
+            for article in data["data"]:
+                article["text"] = img_src.sub(img, article["text"])
+            text = "res(" + json.dumps(data, ensure_ascii=False) + ");"
+        else:
+            text = img_src.sub(img, text)
+        saved.setdefault(kind, []).append(text.encode("utf-8"))
+
+    return saved
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "ReplayServer"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        fixture = self.server.fixture
+        self.server.count()
+
+        delay = fixture.latency + random.uniform(0, fixture.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if fixture.error_rate > 0 and random.random() < fixture.error_rate:
+            self.send(503, b"unavailable", "text/plain", {"Retry-After": "0"})
+            return
+
+        split = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(split.query).items()}
+        route = self.server.route(split.path)
+        if route is None:
+            self.send(404, b"not found", "text/plain")
+            return
+
+        status, body, content_type = route(split.path, query)
+        headers: dict[str, str] = {}
+        if route == self.server.image:
+            status, body, headers = self.ranged(body)
+
+        # cut the body short to simulate a dropped connection
+        truncate = fixture.truncate_rate > 0 and random.random() < fixture.truncate_rate
+        self.send(status, body, content_type, headers, truncate and len(body) > 1)
+
+    def ranged(self, body: bytes) -> tuple[int, bytes, dict[str, str]]:
+        etag = f'"img-{len(body)}"'
+        headers = {"Accept-Ranges": "bytes", "ETag": etag}
+        range_ = self.headers.get("Range", "")
+        if range_.startswith("bytes=") and self.headers.get("If-Range", etag) == etag:
+            start = int(range_.removeprefix("bytes=").partition("-")[0])
+            if start < len(body):
+                headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+                return 206, body[start:], headers
+
+        return 200, body, headers
+
+    def send(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str,
+        headers: dict[str, str] = {},
+        truncate: bool = False,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if truncate:
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixture: Fixture, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), Handler)
+        self.fixture = fixture
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread: threading.Thread | None = None
+        self.saved = load_saved(fixture.pages, self.url) if fixture.pages else {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self) -> None:
+        with self.lock:
+            self.requests += 1
+
+    def start(self) -> "ReplayServer":
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def route(self, path: str):
+        routes = {
+            "/nogi/s/n46/api/list/member": self.nogi_members,
+            "/nogi/s/n46/api/list/blog": self.nogi_blog,
+            "/sakura/s/s46/search/artist": self.sakura_members,
+            "/sakura/s/s46/diary/blog/list": self.sakura_list,
+            "/hinata/s/official/search/artist": self.hinata_members,
+            "/hinata/s/official/diary/member/list": self.hinata_list,
+        }
+        if path in routes:
+            return routes[path]
+        if path.startswith("/sakura/s/s46/diary/detail/"):
+            return self.sakura_article
+        if path.startswith("/img/"):
+            return self.image
+
+        return None
+
+    def nogi_members(self, path: str, query: dict):
+        data = []
+        for i, code in enumerate(self.fixture.codes()):
+            kanji, english = self.fixture.name(i)
+            data.append({"code": code, "name": kanji, "english_name": english})
+
+        return self.jsonp({"data": data})
+
+    def nogi_blog(self, path: str, query: dict):
+        code = query.get("ct", "")
+        rw = int(query.get("rw", 20))
+        st = int(query.get("st", 0))
+        if "nogi-list" in self.saved:
+            return self.replay("nogi-list", st // rw, "text/javascript")
+
+        data = []
+        if code in self.fixture.codes():
+            for no in range(st, min(st + rw, self.fixture.posts)):
+                date = self.fixture.post_date(code, no)
+                data.append(
+                    {
+                        "date": date.strftime("%Y/%m/%d %H:%M:%S"),
+                        "text": self.fixture.article_html(self.url, "nogi", code, no),
+                    }
+                )
+
+        return self.jsonp({"data": data})
+
+    def sakura_members(self, path: str, query: dict):
+        items = "".join(
+            f'<li class="box" data-member="{code}"><p class="name">{self.fixture.name(i)[0]}</p>'
+            f'<p class="kana">{self.fixture.name(i)[0]}</p></li>'
+            for i, code in enumerate(self.fixture.codes())
+        )
+        return self.html(f'<div class="member-elem"><ul>{items}</ul></div>')
+
+    def sakura_list(self, path: str, query: dict):
+        code = query.get("ct", "")
+        if "sakura-list" in self.saved:
+            return self.replay("sakura-list", int(query.get("page", 0)))
+
+        items = ""
+        for no in self.page_range(code, int(query.get("page", 0))):
+            date = self.fixture.post_date(code, no)
+            items += (
+                f'<li class="box"><a href="/s/s46/diary/detail/{code}-{no}?ima=0000&cd=blog">'
+                f'<p class="date">{date.strftime("%Y/%m/%d")}</p></a></li>'
+            )
+
+        return self.html(f'<div class="com-blog-part"><ul>{items}</ul></div>')
+
+    def sakura_article(self, path: str, query: dict):
+        if "sakura-article" in self.saved:
+            # saved list pages link real article ids, spread over the saved ones
+            articles = self.saved["sakura-article"]
+            digits = re.sub(r"\D", "", path.rsplit("/", 1)[1])
+            index = int(digits or 0) % len(articles)
+            return 200, articles[index], "text/html; charset=utf-8"
+
+        code, no = path.rsplit("/", 1)[1].split("-")
+        article = self.fixture.article_html(self.url, "sakura", code, int(no))
+        return self.html(f'<div class="box-article">{article}</div>')
+
+    def hinata_members(self, path: str, query: dict):
+        items = "".join(
+            f'<li data-member="{code}"><div class="c-member__name">{self.fixture.name(i)[0]}</div>'
+            f'<div class="c-member__kana">{self.fixture.name(i)[0]}</div></li>'
+            for i, code in enumerate(self.fixture.codes())
+        )
+        return self.html(f'<div class="sort-default"><ul>{items}</ul></div>')
+
+    def hinata_list(self, path: str, query: dict):
+        code = query.get("ct", "")
+        if "hinata-list" in self.saved:
+            return self.replay("hinata-list", int(query.get("page", 0)))
+
+        items = ""
+        for no in self.page_range(code, int(query.get("page", 0))):
+            date = self.fixture.post_date(code, no)
+            article = self.fixture.article_html(self.url, "hinata", code, no)
+            items += (
+                f'<div class="p-blog-article"><div class="c-blog-article__date">'
+                f'{date.strftime("%Y.%m.%d %H:%M")}</div>{article}</div>'
+            )
+
+        return self.html(f"<main>{items}</main>")
+
+    def replay(
+        self, kind: str, page_no: int, content_type: str = "text/html; charset=utf-8"
+    ):
+        pages = self.saved[kind]
+        body = pages[page_no] if page_no < len(pages) else empty_pages[kind]
+        return 200, body, content_type
+
+    def image(self, path: str, query: dict):
+        return 200, self.fixture.image, "image/jpeg"
+
+    def page_range(self, code: str, page_no: int) -> range:
+        if code not in self.fixture.codes():
+            return range(0)
+
+        start = page_no * self.fixture.page_size
+        return range(start, min(start + self.fixture.page_size, self.fixture.posts))
+
+    def jsonp(self, data: dict):
+        body = "res(" + json.dumps(data, ensure_ascii=False) + ");"
+        return 200, body.encode("utf-8"), "text/javascript"
+
+    def html(self, body: str):
+        # header/nav markup around the content, as on the real pages
+        nav = "".join(
+            f'<li class="nav-item"><a href="/link/{i}"><img src="/icon/{i}.png">'
+            f"<span>menu {i}</span></a></li>"
+            for i in range(self.fixture.chrome)
+        )
+        page = (
+            "<!DOCTYPE html><html><head><title>bench</title></head><body>"
+            f"<header><ul>{nav}</ul></header>{body}<footer><ul>{nav}</ul></footer>"
+            "</body></html>"
+        )
+        return 200, page.encode("utf-8"), "text/html; charset=utf-8"
+
+
+def add_fixture_options(argparser: ArgumentParser) -> None:
+    for field in fields(Fixture):
+        argparser.add_argument(
+            "--" + field.name, type=type(field.default), default=field.default
+        )
+
+
+def fixture_argv(args) -> list[str]:
+    argv = []
+    for field in fields(Fixture):
+        argv += ["--" + field.name, str(getattr(args, field.name))]
+
+    return argv
+
+
+def fixture_from_args(args) -> Fixture:
+    return Fixture(
+        **{field.name: getattr(args, field.name) for field in fields(Fixture)}
+    )
+
+
+def main() -> None:
+    argparser = ArgumentParser()
+    argparser.add_argument("--port", type=int, default=0)
+    add_fixture_options(argparser)
+    args = argparser.parse_args()
+
+    random.seed(args.seed)
+    server = ReplayServer(fixture_from_args(args), args.port)
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"requests : {server.requests}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,241 @@
 import asyncio
+import os
+import signal
+import subprocess
+import sys
 import time
+import tracemalloc
+import uuid
 
 import httpx
 
+from src import planner
 from src.args import get_option
-from src.crawler import base, hinata, nogi, sakura
+from src.blobstore import blob_store
+from src.budget import budget
+from src.crawler import base, sakura
+from src.deadletter import dead_letters
+from src.httpcache import http_cache
+from src.layout import migrate
 from src.logger import create_logger
+from src.metrics import metrics
+from src.parser import configure as configure_parser
+from src.pool import parse_pool
+from src.postprocess import post_processor
+from src.ratelimit import limiter, parse_rates
 from src.recorder import Recorder
+from src.requests import is_permanent
+from src.roster import roster_cache
+from src.storage import open_storage
+from src.transport import http2_available, parse_connections, transport
+from src.watch import Watcher
+from src.workstore import default_store, open_store
 
 logger = create_logger("main")
 
 recorder = Recorder()
 
 
-async def async_run():
-    async with httpx.AsyncClient() as client:
-        n_infos = await nogi.get_member_info(client)
-        s_infos = await sakura.get_member_info(client)
-        h_infos = await hinata.get_member_info(client)
-        async with base.Crawler(client) as crawler:
-            collectors = []
+async def async_run(**client_options):
+    args = get_option()
+    handle_signals()
+    client_options = {**transport.client_options(), **client_options}
+    async with metrics.serving(), httpx.AsyncClient(**client_options) as client:
+        if args.retry_failed:
+            await retry_failed(client, args)
+            return
 
-            for info in n_infos:
-                collectors.append(
-                    nogi.Collector(client=client, crawler=crawler, **info)
-                )
+        planned = await planner.plan(client, args)
+        if args.dry_run:
+            planner.print_plan(planned)
+            return
 
-            for info in s_infos:
-                collectors.append(
-                    sakura.Collector(client=client, crawler=crawler, **info)
+        store = open_store(args.work_store) if args.work_store else None
+        limit = args.member_concurrency or (4 if store is not None else None)
+        try:
+            async with base.Crawler(
+                client, retry_count=args.retries, retry_delay=args.retry_delay
+            ) as crawler:
+                if args.watch:
+                    watcher = Watcher(
+                        client,
+                        crawler,
+                        args.watch_min,
+                        args.watch_max,
+                        limit,
+                        args.watch_fraction,
+                    )
+                    await watcher.run(args)
+                    return
+                if args.reprocess:
+                    count = await post_processor.submit_existing(logger)
+                    logger.info({"message": "reprocess", "images": count})
+                collectors = await planner.run_collectors(
+                    planned,
+                    client,
+                    crawler,
+                    store,
+                    args.run_id,
+                    limit,
+                    args.claim_lease,
                 )
+            logger.info({"message": "crawled", "members": len(collectors)})
+        finally:
+            if store is not None:
+                store.close()
 
-            for info in h_infos:
-                collectors.append(
-                    hinata.Collector(client=client, crawler=crawler, **info)
-                )
 
-            cors = [c.run() for c in collectors]
-            await asyncio.gather(*cors)
+async def retry_failed(client: httpx.AsyncClient, args) -> None:
+    entries, size = dead_letters.load()
+    # a missing or forbidden image stays that way, only transient failures
+    # are tried again; the skipped ones are dropped with the rest
+    permanent = [e for e in entries if is_permanent(e.get("status"))]
+    entries = [e for e in entries if not is_permanent(e.get("status"))]
+    logger.info(
+        {"message": "retry failed", "images": len(entries), "skipped": len(permanent)}
+    )
+    async with base.Crawler(
+        client, retry_count=args.retries, retry_delay=args.retry_delay
+    ) as crawler:
+        for entry in entries:
+            await crawler.put_todo(
+                [{"url": entry["url"], "path": entry["path"]}],
+                create_logger(entry["logger"]),
+                (entry["group"], entry["code"]),
+            )
+    dead_letters.drop(size)
+
+
+def handle_signals() -> None:
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+
+def shard_metrics(args) -> tuple[str | None, int | None]:
+    json_path, port = args.metrics_json, args.metrics_port
+    if args.shard_index is None:
+        return json_path, port
+
+    if json_path is not None:
+        root, ext = os.path.splitext(json_path)
+        json_path = f"{root}.{args.shard_index}{ext}"
+    if port is not None:
+        port += args.shard_index
+
+    return json_path, port
+
+
+def setup(args) -> None:
+    recorder.open()
+    metrics.reset()
+    if args.trace_memory:
+        tracemalloc.start()
+    budget.configure(
+        int(args.memory_budget * 1024 * 1024) if args.memory_budget else None
+    )
+    metrics.configure(*shard_metrics(args))
+    roster_cache.configure(args.roster_ttl)
+    limiter.configure(parse_rates(args.rate), args.default_rate, args.shard_count)
+    blob_store.configure(args.dedup)
+    http_cache.configure(not args.no_http_cache)
+    if args.http2 and not http2_available():
+        logger.warning("h2 is not installed, falling back to HTTP/1.1")
+    transport.configure(
+        args.http2,
+        args.max_connections,
+        parse_connections(args.host_connections),
+        args.keepalive,
+        args.keepalive_expiry,
+        args.connect_timeout,
+        args.read_timeout,
+    )
+    configure_parser(args.parser)
+    parse_pool.configure(args.parse_procs)
+    post_processor.configure(
+        args.thumbnail, args.transcode, args.back_ground, args.post_procs
+    )
+    base.Base.lookahead = args.lookahead
+    base.Base.backfill_window = args.backfill_window
+    base.Base.layout = args.layout
+    base.Base.resume = args.resume
+    base.Crawler.group_workers = parse_connections(args.group_workers)
+    storage = open_storage(args.storage, args.s3_endpoint, args.upload_parts)
+    base.Base.storage = base.Crawler.storage = storage
+    sakura.Collector.article_concurrency = args.article_concurrency
+
+
+def run_workers(args) -> None:
+    run_id = args.run_id or uuid.uuid4().hex
+    argv = [
+        sys.executable,
+        sys.argv[0],
+        *sys.argv[1:],
+        *("--workers", "1", "--run_id", run_id),
+        *("--work_store", args.work_store or default_store),
+        *("--shard_count", str(args.workers)),
+    ]
+    logger.info({"message": "start workers", "workers": args.workers, "run": run_id})
+    procs = [
+        subprocess.Popen([*argv, "--shard_index", str(i)]) for i in range(args.workers)
+    ]
+
+    def terminate(*_) -> None:
+        for proc in procs:
+            proc.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        codes = [proc.wait() for proc in procs]
+    except KeyboardInterrupt:
+        codes = [proc.wait() for proc in procs]
+    if any(codes):
+        logger.error({"message": "worker failed", "exit codes": codes})
+
+
+def teardown() -> None:
+    metrics.dump_json()
+    logger.info({"memory": metrics.memory()})
+    for line in metrics.top_allocations():
+        logger.info({"allocation": line})
+    tracemalloc.stop()
+    parse_pool.close()
+    post_processor.close()
+    recorder.close()
+    http_cache.close()
+    if blob_store.enabled:
+        blob_store.dump_json()
+        logger.info({"dedup": blob_store.stats()})
 
 
 def main() -> None:
     start = time.perf_counter()
     args = get_option()
-    asyncio.run(async_run(), debug=args.debug)
-    recorder.dump_json()
+    if args.migrate_layout:
+        moved = migrate(base.base_dir, args.layout, logger)
+        recorder.close()
+        logger.info(f"moved {moved} files in {time.perf_counter() - start:.2f}s")
+        return
+    # the dead letters are replayed by a single process
+    if args.workers > 1 and not args.retry_failed:
+        run_workers(args)
+        logger.info(f"Done in {time.perf_counter() - start:.2f}s")
+        return
+
+    setup(args)
+    try:
+        asyncio.run(async_run(), debug=args.debug)
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        if args.watch:
+            logger.info("watch stopped")
+        else:
+            logger.warning("interrupted, run with --resume to continue")
+    finally:
+        teardown()
     end = time.perf_counter()
 
     logger.info(f"Done in {end - start:.2f}s")
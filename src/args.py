@@ -1,6 +1,8 @@
-from argparse import ArgumentParser
+from argparse import SUPPRESS, ArgumentParser
+from functools import cache
 
 
+@cache
 def get_option():
     argparser = ArgumentParser()
     argparser.add_argument(
@@ -21,7 +23,309 @@ def get_option():
     )
     argparser.add_argument("-D", "--debug", action="store_true", help="debug mode")
     argparser.add_argument(
-        "-B", "--back_ground", action="store_true", help="make back ground image"
+        "-B",
+        "--back_ground",
+        action="store_true",
+        help="make a 1920x1080 back ground image of each image under derived/background",
     )
+    argparser.add_argument(
+        "--layout",
+        type=str,
+        choices=["flat", "month"],
+        default="flat",
+        help="save images directly in the member dir or in YYYY/MM sub dirs",
+    )
+    argparser.add_argument(
+        "--migrate_layout",
+        action="store_true",
+        help="move the images already in data/ into --layout and exit",
+    )
+    argparser.add_argument(
+        "--rate",
+        type=str,
+        action="append",
+        metavar="GROUP=RATE",
+        help="max requests per second for each host of a group (nogi/sakura/hinata)",
+    )
+    argparser.add_argument(
+        "--default_rate",
+        type=float,
+        default=None,
+        help="max requests per second for hosts without a group rate (default: 40)",
+    )
+    argparser.add_argument(
+        "--dedup",
+        type=str,
+        choices=["hardlink", "reflink"],
+        default=None,
+        help="store images once by content hash and link them into member dirs",
+    )
+    argparser.add_argument(
+        "--no_http_cache",
+        action="store_true",
+        help="do not send conditional requests (ETag/Last-Modified)",
+    )
+    argparser.add_argument(
+        "--http2",
+        action="store_true",
+        help="use HTTP/2 when the server supports it (requires h2)",
+    )
+    argparser.add_argument(
+        "--max_connections",
+        type=int,
+        default=100,
+        help="max connections per host group",
+    )
+    argparser.add_argument(
+        "--host_connections",
+        type=str,
+        action="append",
+        metavar="GROUP=N",
+        help="max connections for the hosts of a group (nogi/sakura/hinata)",
+    )
+    argparser.add_argument(
+        "--keepalive",
+        type=int,
+        default=20,
+        help="max idle connections kept alive per host group",
+    )
+    argparser.add_argument(
+        "--keepalive_expiry",
+        type=float,
+        default=5.0,
+        help="seconds an idle connection is kept alive",
+    )
+    argparser.add_argument(
+        "--connect_timeout",
+        type=float,
+        default=5.0,
+        help="seconds to wait for a connection to be established",
+    )
+    argparser.add_argument(
+        "--read_timeout",
+        type=float,
+        default=5.0,
+        help="seconds to wait for data from the server",
+    )
+    argparser.add_argument(
+        "--group_workers",
+        type=str,
+        action="append",
+        metavar="GROUP=N",
+        help="max download workers busy with one group (nogi/sakura/hinata) at a time",
+    )
+    argparser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="split the members across N crawler processes",
+    )
+    argparser.add_argument(
+        "--work_store",
+        type=str,
+        default=None,
+        metavar="URL",
+        help="shared store the processes claim members from (sqlite:PATH or redis://HOST:PORT/DB)",
+    )
+    argparser.add_argument(
+        "--run_id",
+        type=str,
+        default=None,
+        help="name of the crawl shared by all processes using the same work store",
+    )
+    argparser.add_argument(
+        "--member_concurrency",
+        type=int,
+        default=None,
+        help="max members crawled at a time (4 with a work store, unlimited otherwise)",
+    )
+    argparser.add_argument(
+        "--claim_lease",
+        type=float,
+        default=300.0,
+        help="seconds a claimed member stays taken without being renewed; the "
+        "members of a crashed shard are crawled again after this",
+    )
+    argparser.add_argument("--shard_index", type=int, help=SUPPRESS)
+    argparser.add_argument("--shard_count", type=int, default=1, help=SUPPRESS)
+    argparser.add_argument(
+        "--lookahead",
+        type=int,
+        default=2,
+        help="number of blog list pages prefetched ahead of the one being parsed",
+    )
+    argparser.add_argument(
+        "--backfill_window",
+        type=int,
+        default=0,
+        help="for members without a previous crawl, find the last blog list page "
+        "first and then fetch up to N list pages at once (0 keeps --lookahead)",
+    )
+    argparser.add_argument(
+        "--article_concurrency",
+        type=int,
+        default=4,
+        help="max article pages fetched at once per sakurazaka member",
+    )
+    argparser.add_argument(
+        "--parser",
+        type=str,
+        choices=["auto", "lxml", "html.parser"],
+        default="auto",
+        help="BeautifulSoup backend (auto uses lxml when installed)",
+    )
+    argparser.add_argument(
+        "--parse_procs",
+        type=int,
+        default=0,
+        help="number of processes for HTML parsing (0 parses on the event loop)",
+    )
+    argparser.add_argument(
+        "--thumbnail",
+        type=int,
+        default=None,
+        metavar="PX",
+        help="write thumbnails that fit in PX x PX under derived/thumb",
+    )
+    argparser.add_argument(
+        "--transcode",
+        type=str,
+        action="append",
+        choices=["webp", "avif"],
+        help="write a copy of each image in this format under derived/FORMAT",
+    )
+    argparser.add_argument(
+        "--reprocess",
+        action="store_true",
+        help="also run the image processing on images already in data/",
+    )
+    argparser.add_argument(
+        "--post_procs",
+        type=int,
+        default=2,
+        help="number of processes for thumbnails, transcoding and -B",
+    )
+    argparser.add_argument(
+        "--memory_budget",
+        type=float,
+        default=None,
+        metavar="MB",
+        help="max MB of image bodies being transferred at a time",
+    )
+    argparser.add_argument(
+        "--trace_memory",
+        action="store_true",
+        help="trace allocations with tracemalloc and log the largest sites at exit",
+    )
+    argparser.add_argument(
+        "--metrics_json",
+        type=str,
+        default=None,
+        help="write a JSON summary of crawl metrics to this file at exit",
+    )
+    argparser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=None,
+        help="serve Prometheus text metrics on this port while running",
+    )
+    argparser.add_argument(
+        "--log_json",
+        action="store_true",
+        help="write log files as JSON lines",
+    )
+    argparser.add_argument(
+        "--roster_ttl",
+        type=float,
+        default=24 * 60 * 60,
+        help="seconds to reuse the cached member lists before fetching them again",
+    )
+    argparser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and poll each member on an interval learned from its posts",
+    )
+    argparser.add_argument(
+        "--watch_min",
+        type=float,
+        default=300,
+        help="shortest seconds between polls of a member in --watch",
+    )
+    argparser.add_argument(
+        "--watch_max",
+        type=float,
+        default=86400,
+        help="longest seconds between polls of a member in --watch",
+    )
+    argparser.add_argument(
+        "--watch_fraction",
+        type=float,
+        default=0.005,
+        help="share of a member's usual gap between posts to wait between polls "
+        "in --watch, bounded by --watch_min and --watch_max",
+    )
+    argparser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="print the members that would be crawled and their watermarks",
+    )
+    argparser.add_argument(
+        "--resume",
+        action="store_true",
+        help="queue unfinished downloads first and continue list pages where an interrupted run stopped",
+    )
+    argparser.add_argument(
+        "--storage",
+        type=str,
+        default=None,
+        metavar="URL",
+        help="where images are stored: local (data/) or s3://BUCKET/PREFIX",
+    )
+    argparser.add_argument(
+        "--s3_endpoint",
+        type=str,
+        default=None,
+        metavar="URL",
+        help="endpoint of an S3 compatible service such as MinIO",
+    )
+    argparser.add_argument(
+        "--upload_parts",
+        type=int,
+        default=4,
+        help="multipart upload parts sent at once per image for s3 storage",
+    )
+    argparser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="attempts per image before it is written to cache/dead_letters.jsonl",
+    )
+    argparser.add_argument(
+        "--retry_delay",
+        type=float,
+        default=3.0,
+        help="seconds before the first retry of a failed image, doubled for each "
+        "later attempt with random jitter",
+    )
+    argparser.add_argument(
+        "--retry_failed",
+        action="store_true",
+        help="only download the images in cache/dead_letters.jsonl again, "
+        "except those that failed with a permanent 4xx status",
+    )
+
+    args = argparser.parse_args()
+    if args.work_store is not None and args.run_id is None:
+        argparser.error("--work_store needs --run_id")
+    # the watcher polls every member itself and does not claim them
+    if args.watch and (args.workers > 1 or args.work_store is not None):
+        argparser.error("--watch cannot be used with --workers or --work_store")
+    # these read or rewrite the files under data/
+    local_only = [args.dedup, args.migrate_layout, args.reprocess]
+    local_only += [args.thumbnail, args.transcode, args.back_ground]
+    if args.storage not in (None, "local") and any(local_only):
+        argparser.error(
+            "--dedup, --migrate_layout and image processing need --storage local"
+        )
 
-    return argparser.parse_args()
+    return args
@@ -0,0 +1,159 @@
+import errno
+import json
+import os
+import shutil
+import threading
+
+from src.filelock import file_lock
+
+blob_dir = os.path.join(os.getcwd(), "data", ".blobs")
+
+FICLONE = 0x40049409
+
+
+class BlobStore:
+    def __init__(self, root: str = blob_dir) -> None:
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        self.mode: str | None = None
+        self.lock = threading.Lock()
+
+        self.blobs: dict[str, dict] = {}
+        self.urls: dict[str, str] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode is not None
+
+    def configure(self, mode: str | None) -> None:
+        self.mode = mode
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+            self._load_json()
+
+    def _read_json(self) -> dict:
+        if not os.path.isfile(self.index_path):
+            return {}
+
+        with open(self.index_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load_json(self) -> None:
+        data = self._read_json()
+        self.blobs = data.get("blobs", {})
+        self.urls = data.get("urls", {})
+
+    def dump_json(self) -> None:
+        if not self.enabled:
+            return
+
+        # other shards may have written the index since it was loaded
+        with self.lock, open(self.index_path + ".lock", mode="w") as f, file_lock(f):
+            data = self._read_json()
+            for digest, entry in data.get("blobs", {}).items():
+                for path in entry["paths"]:
+                    self._add_path(digest, entry["size"], path)
+            self.urls = {**data.get("urls", {}), **self.urls}
+
+            self._write_json({"blobs": self.blobs, "urls": self.urls})
+
+    def _write_json(self, data: dict) -> None:
+        tmp_path = self.index_path + ".part"
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def move_paths(self, moves: dict[str, str]) -> None:
+        if not moves or not os.path.isfile(self.index_path):
+            return
+
+        with self.lock, open(self.index_path + ".lock", mode="w") as f, file_lock(f):
+            data = self._read_json()
+            for blobs in (data.get("blobs", {}), self.blobs):
+                for entry in blobs.values():
+                    entry["paths"] = [moves.get(p, p) for p in entry["paths"]]
+            self._write_json(data)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def store(self, tmp_path: str, path: str, url: str, digest: str) -> None:
+        blob = self.blob_path(digest)
+        with self.lock:
+            if os.path.exists(blob):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(tmp_path, blob)
+
+            self._link(blob, path)
+            self._add(digest, os.path.getsize(blob), path, url)
+
+    def link_url(self, url: str, path: str) -> int | None:
+        with self.lock:
+            digest = self.urls.get(url)
+            if digest is None:
+                return None
+
+            blob = self.blob_path(digest)
+            if not os.path.exists(blob):
+                return None
+
+            size = os.path.getsize(blob)
+            self._link(blob, path)
+            self._add(digest, size, path, url)
+
+        return size
+
+    def _add(self, digest: str, size: int, path: str, url: str) -> None:
+        self._add_path(digest, size, path)
+        self.urls[url] = digest
+
+    def _add_path(self, digest: str, size: int, path: str) -> None:
+        entry = self.blobs.setdefault(digest, {"size": size, "paths": []})
+        if path not in entry["paths"]:
+            entry["paths"].append(path)
+
+    def _link(self, blob: str, path: str) -> None:
+        tmp_path = path + ".part"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        if self.mode == "reflink":
+            reflink(blob, tmp_path)
+        else:
+            try:
+                os.link(blob, tmp_path)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                shutil.copyfile(blob, tmp_path)
+
+        os.replace(tmp_path, path)
+
+    def stats(self) -> dict:
+        with self.lock:
+            refs = sum(len(b["paths"]) for b in self.blobs.values())
+            physical = sum(b["size"] for b in self.blobs.values())
+            logical = sum(b["size"] * len(b["paths"]) for b in self.blobs.values())
+
+        return {
+            "blobs": len(self.blobs),
+            "files": refs,
+            "logical bytes": logical,
+            "stored bytes": physical,
+            "saved bytes": logical - physical,
+        }
+
+
+def reflink(src: str, dst: str) -> None:
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            import fcntl
+
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except (ImportError, OSError):
+            shutil.copyfileobj(s, d)
+
+
+blob_store = BlobStore()
@@ -0,0 +1,42 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class ByteBudget:
+    def __init__(self) -> None:
+        self.limit: int | None = None
+        self.used = 0
+        self.peak = 0
+        self.changed = asyncio.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit is not None
+
+    def configure(self, limit: int | None) -> None:
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.changed = asyncio.Condition()
+
+    @asynccontextmanager
+    async def hold(self, size: int):
+        if self.limit is None:
+            yield
+            return
+
+        # a single body larger than the budget still gets through on its own
+        size = min(size, self.limit)
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.used + size <= self.limit)
+            self.used += size
+            self.peak = max(self.peak, self.used)
+        try:
+            yield
+        finally:
+            self.used -= size
+            async with self.changed:
+                self.changed.notify_all()
+
+
+budget = ByteBudget()
@@ -1,15 +1,32 @@
 import asyncio
 import os
 import re
+import time
+from collections import deque
 from datetime import datetime
-from typing import Iterable, List, Optional, TypedDict
+from typing import AsyncIterator, Callable, Deque, Iterable, List, Optional, TypedDict
 
 import httpx
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup
 
+from src.blobstore import blob_store
+from src.deadletter import dead_letters
+from src.httpcache import http_cache, is_not_modified
+from src.layout import image_dir
 from src.logger import Logger, create_logger
-from src.recorder import Recorder, date_format
-from src.requests import create_get_req
+from src.metrics import metrics
+from src.pool import parse_pool
+from src.postprocess import post_processor
+from src.recorder import Recorder
+from src.requests import (
+    StatusError,
+    backoff,
+    create_download_req,
+    create_get_req,
+    is_permanent,
+)
+from src.scheduler import Scheduler, backfill, fresh
+from src.storage import LocalStorage, S3Storage
 
 recorder = Recorder()
 
@@ -25,16 +42,30 @@ class ImageInfo(TypedDict):
 
 
 class Crawler:
+    group_workers: dict[str, int] = {}
+    storage: LocalStorage | S3Storage = LocalStorage()
+
     def __init__(
         self,
         client: httpx.AsyncClient,
         num_workers: int = 20,
         retry_count: int = 3,
+        retry_delay: float = 3.0,
     ):
-        self.async_get = create_get_req(client)
+        self.async_download = create_download_req(
+            client, self.storage.upload, self.storage.partial, self.storage.discard
+        )
         self.retry_count = retry_count
-
-        self.todo: asyncio.Queue = asyncio.Queue(maxsize=num_workers * 3)
+        self.retry_delay = retry_delay
+
+        self.todo = Scheduler(num_workers * 3, self.group_workers)
+        self.queued: set[str] = set()
+        # failed downloads wait here instead of in a worker slot
+        self.attempts: dict[str, int] = {}
+        self.resume: dict[str, dict[str, str]] = {}
+        self.retries: set[asyncio.Task] = set()
+        self.dirs: set[str] = set()
+        metrics.workers += num_workers
         self.workers = [
             asyncio.create_task(self._worker(i)) for i in range(num_workers)
         ]
@@ -47,32 +78,147 @@ class Crawler:
                 return
 
     async def _process_one(self, worker_index: int):
-        info, logger = await self.todo.get()
-        await self._download(info, logger, worker_index)
-        self.todo.task_done()
+        group, (info, logger, member) = await self.todo.get()
+        metrics.set_queue_depth(self.todo.qsize())
+        start = time.perf_counter()
+        try:
+            await self._download(info, logger, member, worker_index)
+        finally:
+            metrics.add_busy(time.perf_counter() - start)
+            if info["path"] not in self.attempts:
+                self.queued.discard(info["path"])
+            await self.todo.task_done(group)
 
     async def __aenter__(self):
+        post_processor.start()
         return self
 
-    async def __aexit__(self, *args):
+    async def __aexit__(self, exc_type, *args):
+        if exc_type is None:
+            await self.join()
+        await post_processor.stop(drain=exc_type is None)
+        for task in [*self.workers, *self.retries]:
+            task.cancel()
+        await asyncio.gather(*self.workers, *self.retries, return_exceptions=True)
+        self.remove_empty_dirs()
+
+    def remove_empty_dirs(self):
+        # a member's directory is made up front, so the ones that got no
+        # image are removed once every download has finished
+        for dir in self.dirs:
+            self.storage.remove_dir(dir)
+
+    async def join(self):
         await self.todo.join()
-        for worker in self.workers:
-            worker.cancel()
+        while self.retries:
+            await asyncio.gather(*self.retries)
+            await self.todo.join()
 
-    async def put_todo(self, infos: Iterable[ImageInfo], logger: Logger):
+    async def put_todo(
+        self,
+        infos: Iterable[ImageInfo],
+        logger: Logger,
+        owner: tuple[str, str],
+        priority: int = fresh,
+    ):
         for info in infos:
-            await self.todo.put((info, logger))
+            if info["path"] in self.queued:
+                continue
+            self.queued.add(info["path"])
+            await self.todo.put(*owner, (info, logger, owner), priority)
+            metrics.set_queue_depth(self.todo.qsize())
+
+    async def _download(
+        self,
+        info: ImageInfo,
+        logger: Logger,
+        member: tuple[str, str],
+        worker_index: int,
+    ):
+        if blob_store.enabled:
+            size = await asyncio.to_thread(
+                blob_store.link_url, info["url"], info["path"]
+            )
+            if size is not None:
+                logger.debug({"dedup": info["url"], "worker": worker_index})
+                recorder.image_done(info["path"], size)
+                metrics.downloaded(*owner(info["path"]), size)
+                post_processor.submit(info["path"], logger)
+                return
 
-    async def _download(self, info: ImageInfo, logger: Logger, worker_index: int):
-        res = await self.async_get(info["url"], logger=logger, worker=worker_index)
-        if res is None:
+        # replayed dead letters have no collector that made the directory
+        await asyncio.to_thread(self.storage.make_dir, os.path.dirname(info["path"]))
+        try:
+            size = await self.async_download(
+                info["url"],
+                info["path"],
+                logger=logger,
+                worker=worker_index,
+                resume=self.resume.setdefault(info["path"], {}),
+            )
+        except Exception as e:
+            await self._retry(info, logger, member, e)
+            return
+
+        self.attempts.pop(info["path"], None)
+        self.resume.pop(info["path"], None)
+        if size is None:
+            await self._give_up(info, logger, member, "not found", 1, 404)
+        else:
+            recorder.image_done(info["path"], size)
+            metrics.downloaded(*owner(info["path"]), size)
+            post_processor.submit(info["path"], logger)
+
+    async def _retry(
+        self, info: ImageInfo, logger: Logger, member: tuple[str, str], e: Exception
+    ):
+        attempt = self.attempts.pop(info["path"], 0) + 1
+        status = e.status if isinstance(e, StatusError) else None
+        if attempt >= self.retry_count or is_permanent(status):
+            self.resume.pop(info["path"], None)
+            await asyncio.to_thread(self.storage.discard, info["path"])
+            await self._give_up(info, logger, member, repr(e), attempt, status)
             return
 
-        with open(info["path"], "wb") as f:
-            f.write(res.content)
+        self.attempts[info["path"]] = attempt
+        metrics.retry(info["url"])
+        delay = backoff(attempt - 1, self.retry_delay)
+        task = asyncio.create_task(self._requeue(info, logger, member, delay))
+        self.retries.add(task)
+        task.add_done_callback(self.retries.discard)
+
+    async def _requeue(
+        self, info: ImageInfo, logger: Logger, member: tuple[str, str], delay: float
+    ):
+        await asyncio.sleep(delay)
+        await self.todo.put(*member, (info, logger, member), backfill)
+        metrics.set_queue_depth(self.todo.qsize())
+
+    async def _give_up(
+        self,
+        info: ImageInfo,
+        logger: Logger,
+        member: tuple[str, str],
+        reason: str,
+        attempts: int,
+        status: int | None = None,
+    ):
+        recorder.image_failed(info["path"])
+        await asyncio.to_thread(
+            dead_letters.add, info, member, logger.name, reason, attempts, status
+        )
+        logger.error({"dead letter": info["url"], "reason": reason})
 
 
 class Base:
+    lookahead: int = 2
+    backfill_window: int = 0
+    layout: str = "flat"
+    resume: bool = False
+    storage: LocalStorage | S3Storage = LocalStorage()
+    # the list page parser of the group, run in the parse pool
+    parse_list: Callable[[str], list]
+
     def __init__(
         self,
         client: httpx.AsyncClient,
@@ -93,48 +239,186 @@ class Base:
         self.group = group
         self.code = code
         self.count: int = 0
-        self.date: datetime = datetime.now()
+        self.date: datetime | None = None
         self.latest_date: datetime = date if date else datetime(2000, 1, 1)
+        # a member without a watermark is crawling its whole history
+        self.priority: int = fresh if date is not None else backfill
         self.No: int = 0
+        self.conditional_urls: List[str] = []
+        self.start_page: int = 0
         self.base_url = base_url
         self.dir = os.path.join(base_dir, group, kanji_name)
-        make_dir(self.dir)
+        self.storage.make_dir(self.dir)
+        crawler.dirs.add(self.dir)
+        recorder.seed_total(group, code)
 
     def __str__(self):
         return f"{self.english_name}, new : {self.count}, total : {self.count_files()}"
 
-    def __del__(self) -> None:
-        try:
-            os.rmdir(self.dir)
-        except OSError as e:
-            e
-            pass
-
     async def run(self, func, *args):
         self.logger.info({"message": "start"})
+        if self.resume:
+            pending = recorder.pending_downloads(self.group, self.code)
+            self.start_page = recorder.get_cursor(self.group, self.code) or 0
+            self.logger.info(
+                {"message": "resume", "pending": len(pending), "page": self.start_page}
+            )
+            await self.put_todo(pending, backfill)
+
         await func(*args)
-        recorder.record[self.group][self.code] = {
-            "name": self.kanji_name,
-            "total": self.count_files(),
-            "date": datetime.now()
-            .replace(hour=0, minute=0, second=0, microsecond=0)
-            .strftime(date_format),
-        }
+        recorder.clear_cursor(self.group, self.code)
+        http_cache.commit(self.conditional_urls)
+        total = self.count_files()
+        newest = recorder.newest_article(self.group, self.code)
+        recorder.update_member(
+            self.group,
+            self.code,
+            self.kanji_name,
+            total,
+            max(newest, self.latest_date) if newest else self.latest_date,
+        )
+        metrics.member(self.group, self.kanji_name, self.count, total)
         self.logger.info({"message": "end", "count": self.count})
 
-    def collect_image(self, date: datetime, soup: BeautifulSoup) -> List[ImageInfo]:
+    async def get_list(self, url: str, conditional: bool = False):
+        res = await self.async_get(url, self.logger, conditional=conditional)
+        if conditional:
+            self.conditional_urls.append(url)
+        if is_not_modified(res):
+            self.logger.info({"message": "not modified", "url": url})
+            return None
+
+        return res
+
+    async def iter_pages(
+        self, page_url: Callable[[int], str], step: int = 1
+    ) -> AsyncIterator[httpx.Response]:
+        page_no = self.start_page
+        if page_no == 0:
+            res = await self.get_list(page_url(0), conditional=True)
+            if res is None:
+                return
+            yield res
+            page_no = step
+            recorder.save_cursor(self.group, self.code, page_no)
+
+        last_no, probed = None, {}
+        window = self.lookahead + 1
+        if self.backfill_window and self.priority == backfill:
+            last_no, probed = await self.find_last_page(page_url, step, page_no)
+            if last_no is not None:
+                window = self.backfill_window
+                self.logger.info({"message": "backfill", "pages": last_no // step + 1})
+
+        def fetch(no: int) -> asyncio.Future:
+            if no in probed:
+                future = asyncio.get_running_loop().create_future()
+                future.set_result(probed.pop(no))
+                return future
+            return asyncio.create_task(self.get_list(page_url(no)))
+
+        # later pages are only prefetched once the first one did not reach the
+        # watermark; anything still in flight is cancelled when the caller stops
+        tasks: Deque[tuple[int, asyncio.Future]] = deque()
+        try:
+            while True:
+                while len(tasks) < window and (last_no is None or page_no <= last_no):
+                    tasks.append((page_no, fetch(page_no)))
+                    page_no += step
+                if not tasks:
+                    return
+
+                done_no, task = tasks.popleft()
+                res = await task
+                if res is None:
+                    return
+                yield res
+                recorder.save_cursor(self.group, self.code, done_no + step)
+        finally:
+            for _, task in tasks:
+                task.cancel()
+
+    async def find_last_page(
+        self, page_url: Callable[[int], str], step: int, first: int
+    ) -> tuple[int | None, dict[int, httpx.Response]]:
+        # gallops from the first unread page until a page comes back empty, then
+        # narrows the gap; every round probes `backfill_window` pages at once and
+        # the pages with articles are kept for reuse
+        probed: dict[int, httpx.Response] = {}
+
+        async def probe(index: int) -> bool | None:
+            res = await self.get_list(page_url(index * step))
+            if res is None:
+                return None
+            if await self.count_articles(res) == 0:
+                return False
+            probed[index * step] = res
+            return True
+
+        # a single probe per round would walk the pages one by one
+        width = max(2, self.backfill_window)
+        low, high, reach = first // step - 1, None, 1
+        while high is None or high - low > 1:
+            if high is None:
+                indexes = [low + reach * 2**i for i in range(width)]
+                reach *= 2**width
+            else:
+                indexes = sorted(
+                    {low + (high - low) * (i + 1) // (width + 1) for i in range(width)}
+                    - {low}
+                )
+            found = await asyncio.gather(*[probe(index) for index in indexes])
+            if None in found:
+                return None, probed
+
+            for index, has_articles in zip(indexes, found):
+                if has_articles:
+                    low = max(low, index)
+                elif high is None or index < high:
+                    high = index
+
+        return low * step, probed
+
+    async def count_articles(self, res: httpx.Response) -> int:
+        return len(await self.parse(self.parse_list, res.text))
+
+    async def parse(self, func, *args):
+        start = time.perf_counter()
+        result = await parse_pool.run(func, *args)
+        metrics.observe_parse(
+            func.__module__.rsplit(".", 1)[-1] + "." + func.__name__,
+            time.perf_counter() - start,
+        )
+        return result
+
+    def pending_images(self, key: str) -> List[ImageInfo] | None:
+        return recorder.pending_images(self.group, self.code, key)
+
+    def add_article(self, key: str, date: datetime, infos: List[ImageInfo]) -> None:
+        recorder.add_article(self.group, self.code, key, date, infos)
+
+    async def put_todo(
+        self, infos: List[ImageInfo], priority: int | None = None
+    ) -> None:
+        if priority is None:
+            priority = self.priority
+        await self.crawler.put_todo(
+            infos, self.logger, (self.group, self.code), priority
+        )
+
+    def collect_image(self, date: datetime, srcs: List[str | None]) -> List[ImageInfo]:
         self.logger.info(
             {"message": "collect image", "date": date.strftime("%Y-%m-%d")}
         )
         label = self.english_name + "-" + date.strftime("%Y%m%d")
-        path = os.path.join(self.dir, label)
-
-        imgs = soup.select("img")
+        directory = image_dir(self.dir, self.layout, date)
+        self.storage.make_dir(directory)
+        path = os.path.join(directory, label)
 
         list_: List[ImageInfo] = []
-        for img in imgs:
+        for href in srcs:
             self._check_no(date)
-            res = self._get_img(img, path)
+            res = self._get_img(href, path)
             if res is None:
                 continue
 
@@ -143,8 +427,7 @@ class Base:
 
         return list_
 
-    def _get_img(self, img: Tag, path: str) -> ImageInfo | None:
-        href = img.get("src")
+    def _get_img(self, href: str | None, path: str) -> ImageInfo | None:
         if href is None:
             return None
         elif self._check_full_path(href):
@@ -167,19 +450,23 @@ class Base:
         return bool(result)
 
     def _check_no(self, date: datetime) -> None:
-        if self.date.date() != date.date():
-            self.No = 0
+        if self.date is None or self.date.date() != date.date():
+            self.No = recorder.count_day_images(self.group, self.code, date)
             self.date = date
 
         self.No += 1
 
     def count_files(self) -> int:
-        return len(os.listdir(self.dir))
+        return recorder.file_total(self.group, self.code)
 
     def check_date(self, date: datetime):
         return self.latest_date >= date
 
 
-def make_dir(path: str):
-    if not os.path.isdir(path):
-        os.makedirs(path)
+def image_srcs(soup: BeautifulSoup) -> List[str | None]:
+    return [img.get("src") for img in soup.select("img")]
+
+
+def owner(path: str) -> tuple[str, str]:
+    group, name = os.path.relpath(path, base_dir).split(os.sep)[:2]
+    return group, name
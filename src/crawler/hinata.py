@@ -1,22 +1,38 @@
+from contextlib import aclosing
 from datetime import datetime
 
 import httpx
-from bs4 import BeautifulSoup
-from pykakasi import kakasi
 
-from src.recorder import Recorder, date_format
+from src.parser import make_soup, strainer
+from src.recorder import date_format
+from src.roster import attach_dates, fetch_page, roster_cache
 
-from .base import Base, Crawler
+from .base import Base, Crawler, image_srcs
 
-recorder = Recorder()
-record_getter = recorder.call_getter("hinata")
+base_url = "https://www.hinatazaka46.com/s/official/"
 
-kks = kakasi()
+list_strainer = strainer(class_="p-blog-article")
+member_strainer = strainer(class_="sort-default")
 
-base_url = "https://www.hinatazaka46.com/s/official/"
+
+def parse_list(text: str) -> list[tuple[datetime, list[str | None]]]:
+    soup = make_soup(text, list_strainer)
+
+    list_ = []
+    for article in soup.select(".p-blog-article"):
+        date_tag = (
+            article.find("div", {"class": "c-blog-article__date"}).get_text().strip()
+        )
+        date = datetime.strptime(date_tag, "%Y.%m.%d %H:%M")
+        list_.append((date, image_srcs(article)))
+
+    soup.decompose()
+    return list_
 
 
 class Collector(Base):
+    parse_list = staticmethod(parse_list)
+
     def __init__(
         self,
         client: httpx.AsyncClient,
@@ -38,43 +54,50 @@ class Collector(Base):
         )
 
     async def run(self):
-        await super().run(self.page, 0)
+        await super().run(self.pages)
+
+    async def pages(self):
+        async with aclosing(self.iter_pages(self.page_url)) as pages:
+            async for res in pages:
+                articles = await self.parse(parse_list, res.text)
 
-    async def page(self, page_no: int):
-        url = base_url + f"diary/member/list?page={str(page_no)}&ct={self.code}"
-        res = await self.async_get(url, self.logger)
-        if res is None:
-            return
-        soup = BeautifulSoup(res.text, "html.parser")
-        articles = soup.select(".p-blog-article")
+                if len(articles) == 0:
+                    return
 
-        if len(articles) == 0:
-            return
+                for date, srcs in articles:
+                    if self.check_date(date):
+                        return
 
-        for article in articles:
-            date_tag = (
-                article.find("div", {"class": "c-blog-article__date"})
-                .get_text()
-                .strip()
-            )
-            date = datetime.strptime(date_tag, "%Y.%m.%d %H:%M")
-            if self.check_date(date):
-                return
+                    await self.article(srcs, date)
 
-            await self.article(article, date)
+    def page_url(self, page_no: int) -> str:
+        return base_url + f"diary/member/list?page={str(page_no)}&ct={self.code}"
 
-        await self.page(page_no + 1)
+    async def article(self, srcs: list[str | None], date: datetime):
+        key = date.strftime(date_format)
+        infos = self.pending_images(key)
+        if infos is None:
+            infos = self.collect_image(date, srcs)
+            self.add_article(key, date, infos)
 
-    async def article(self, article: BeautifulSoup, date: datetime):
-        await self.crawler.put_todo(self.collect_image(date, article), self.logger)
+        await self.put_todo(infos)
 
 
 async def get_member_info(client: httpx.AsyncClient):
+    list_ = await roster_cache.get("hinata", lambda: fetch_members(client))
+    list_ = list_ + [{"kanji_name": "ポカ", "english_name": "poka", "code": "000"}]
+
+    return attach_dates("hinata", list_)
+
+
+async def fetch_members(client: httpx.AsyncClient):
     url = base_url + "search/artist"
 
-    res = await client.get(url)
+    res = await fetch_page(client, url)
+    if res is None:
+        return []
 
-    bs4_blog = BeautifulSoup(res.text, "html.parser")
+    bs4_blog = make_soup(res.text, member_strainer)
     members = bs4_blog.select(".sort-default li")
 
     list_ = []
@@ -85,36 +108,16 @@ async def get_member_info(client: httpx.AsyncClient):
         name_kana = member.find("div", {"class": "c-member__kana"}).get_text().strip()
         last = name_kana.split()[0]
         first = name_kana.split()[1]
-        first = kks.convert(first)[0]["hepburn"]
-        last = kks.convert(last)[0]["hepburn"]
+        first = roster_cache.romanize(first)
+        last = roster_cache.romanize(last)
         english = first + "_" + last
 
-        record = record_getter(code)
-        date = None
-        if record is not None:
-            date = datetime.strptime(record.get("date"), date_format)
-
         list_.append(
             {
                 "kanji_name": kanji,
                 "english_name": english,
                 "code": code,
-                "date": date,
             }
         )
 
-    record = record_getter("000")
-    date = None
-    if record is not None:
-        date = datetime.strptime(record.get("date"), date_format)
-
-    list_.append(
-        {
-            "kanji_name": "ポカ",
-            "english_name": "poka",
-            "code": "000",
-            "date": date,
-        }
-    )
-
     return list_
@@ -1,20 +1,21 @@
 import json
+from contextlib import aclosing
 from datetime import datetime
 
 import httpx
-from bs4 import BeautifulSoup
 
-from src.recorder import Recorder, date_format
+from src.parser import make_soup, strainer
+from src.recorder import date_format
+from src.roster import attach_dates, fetch_page, roster_cache
 
-from .base import Base, Crawler
-
-recorder = Recorder()
-record_getter = recorder.call_getter("nogi")
+from .base import Base, Crawler, image_srcs
 
 base_url = "https://www.nogizaka46.com"
 headers = {"Accept": "application/json"}
 limit = 20
 
+image_strainer = strainer("img")
+
 const_list = [
     {"code": "40001", "kanji": "新4期生", "english": "new.fourth"},
     {"code": "40003", "kanji": "運営スタッフ", "english": "staff"},
@@ -25,7 +26,19 @@ const_list = [
 ]
 
 
+def parse_list(text: str) -> list[tuple[datetime, list[str | None]]]:
+    # the whole page goes to the parse pool at once, json and article bodies
+    list_ = []
+    for article in parse_json(text).get("data") or []:
+        date = datetime.strptime(article["date"], "%Y/%m/%d %H:%M:%S")
+        list_.append((date, parse_article(article["text"])))
+
+    return list_
+
+
 class Collector(Base):
+    parse_list = staticmethod(parse_list)
+
     def __init__(
         self,
         client: httpx.AsyncClient,
@@ -40,44 +53,53 @@ class Collector(Base):
         )
 
     async def run(self):
-        await super().run(self.page, 0)
+        await super().run(self.pages)
+
+    async def pages(self):
+        async with aclosing(self.iter_pages(self.page_url, limit)) as pages:
+            async for res in pages:
+                articles = await self.parse(parse_list, res.text)
+                if len(articles) == 0:
+                    return
+
+                for date, srcs in articles:
+                    if self.check_date(date):
+                        return
+
+                    await self.article(srcs, date)
 
-    async def page(self, offset: int):
-        url = (
+    def page_url(self, offset: int) -> str:
+        return (
             base_url
             + f"/s/n46/api/list/blog?rw={str(limit)}&st={str(offset)}&ct={self.code}&callback=res"
         )
-        res = await self.async_get(url, self.logger)
-        if res is None:
-            return
 
-        article_data = parse_json(res.text)
-        articles: list[dict] = article_data.get("data")
-        if len(articles) == 0:
-            return
+    async def article(self, srcs: list[str | None], date: datetime):
+        key = date.strftime(date_format)
+        infos = self.pending_images(key)
+        if infos is None:
+            infos = self.collect_image(date, srcs)
+            self.add_article(key, date, infos)
 
-        for article in articles:
-            date_text = article["date"]
-            date = datetime.strptime(date_text, "%Y/%m/%d %H:%M:%S")
-            if self.check_date(date):
-                return
-            text = article["text"]
-            soup = BeautifulSoup(text, "html.parser")
+        await self.put_todo(infos)
 
-            if self.check_date(date):
-                return
 
-            await self.article(soup, date)
-
-        await self.page(offset + limit)
+async def get_member_info(client: httpx.AsyncClient):
+    list_ = await roster_cache.get("nogi", lambda: fetch_members(client))
+    list_ = list_ + [
+        {"kanji_name": c["kanji"], "english_name": c["english"], "code": c["code"]}
+        for c in const_list
+    ]
 
-    async def article(self, article: BeautifulSoup, date: datetime):
-        await self.crawler.put_todo(self.collect_image(date, article), self.logger)
+    return attach_dates("nogi", list_)
 
 
-async def get_member_info(client: httpx.AsyncClient):
+async def fetch_members(client: httpx.AsyncClient):
     url = base_url + "/s/n46/api/list/member?callback=res"
-    res = await client.get(url)
+    res = await fetch_page(client, url)
+    if res is None:
+        return []
+
     res_json = parse_json(res.text)
 
     member_data = res_json.get("data")
@@ -91,37 +113,22 @@ async def get_member_info(client: httpx.AsyncClient):
             english = english[1] + "_" + english[0]
             code = member["code"]
 
-            record = record_getter(code)
-            date = None
-            if record is not None:
-                date = datetime.strptime(record.get("date"), date_format)
-
             list_.append(
                 {
                     "kanji_name": member["name"],
                     "english_name": english,
                     "code": code,
-                    "date": date,
                 }
             )
 
-    for c in const_list:
-        record = record_getter(c["code"])
+    return list_
 
-        date = None
-        if record is not None:
-            date = datetime.strptime(record.get("date"), date_format)
 
-        list_.append(
-            {
-                "kanji_name": c["kanji"],
-                "english_name": c["english"],
-                "code": c["code"],
-                "date": date,
-            }
-        )
-
-    return list_
+def parse_article(text: str) -> list[str | None]:
+    soup = make_soup(text, image_strainer)
+    srcs = image_srcs(soup)
+    soup.decompose()
+    return srcs
 
 
 def parse_json(text):
@@ -1,23 +1,38 @@
 import asyncio
+from contextlib import aclosing
 from datetime import datetime
 
 import httpx
-from bs4 import BeautifulSoup
-from pykakasi import kakasi
 
-from src.recorder import Recorder, date_format
+from src.parser import make_soup, strainer
+from src.roster import attach_dates, fetch_page, roster_cache
 
-from .base import Base, Crawler
+from .base import Base, Crawler, image_srcs
 
-recorder = Recorder()
-record_getter = recorder.call_getter("sakura")
+base_url = "https://sakurazaka46.com"
 
-kks = kakasi()
+list_strainer = strainer(class_="com-blog-part")
+article_strainer = strainer("div", class_="box-article")
+member_strainer = strainer(class_="member-elem")
 
-base_url = "https://sakurazaka46.com"
+
+def parse_list(text: str) -> list[tuple[str, datetime]]:
+    soup = make_soup(text, list_strainer)
+
+    list_ = []
+    for article in soup.select(".com-blog-part li.box"):
+        path = article.find("a")["href"]
+        date_tag = article.find("p", {"class": "date"})
+        list_.append((path, datetime.strptime(date_tag.text, "%Y/%m/%d")))
+
+    soup.decompose()
+    return list_
 
 
 class Collector(Base):
+    parse_list = staticmethod(parse_list)
+    article_concurrency: int = 4
+
     def __init__(
         self,
         client: httpx.AsyncClient,
@@ -37,46 +52,90 @@ class Collector(Base):
             "sakura",
             date,
         )
+        self.semaphore = asyncio.Semaphore(self.article_concurrency)
 
     async def run(self):
-        await super().run(self.page, 0)
-
-    async def page(self, page_no: int):
-        url = base_url + f"/s/s46/diary/blog/list?page={str(page_no)}&ct={self.code}"
-        res = await self.async_get(url, self.logger)
-        if res is None:
-            return
-        soup = BeautifulSoup(res.text, "html.parser")
-        articles = soup.select(".com-blog-part li.box")
-
-        if len(articles) == 0:
-            return
-
-        for article in articles:
-            path = article.find("a")["href"]
-            date_tag = article.find("p", {"class": "date"})
-            date = datetime.strptime(date_tag.text, "%Y/%m/%d")
-            if self.check_date(date):
+        await super().run(self.pages)
+
+    async def pages(self):
+        async with aclosing(self.iter_pages(self.page_url)) as pages:
+            async for res in pages:
+                articles = await self.parse(parse_list, res.text)
+
+                if len(articles) == 0:
+                    return
+
+                items: list[tuple[str, datetime]] = []
+                reached = False
+                for path, date in articles:
+                    if self.check_date(date):
+                        reached = True
+                        break
+
+                    items.append((path, date))
+
+                await self.articles(items)
+                if reached:
+                    return
+
+    def page_url(self, page_no: int) -> str:
+        return base_url + f"/s/s46/diary/blog/list?page={str(page_no)}&ct={self.code}"
+
+    async def articles(self, items: list[tuple[str, datetime]]):
+        # article pages are fetched concurrently but collected in list order so
+        # that image numbering stays the same as a serial crawl
+        results = await asyncio.gather(*[self.fetch_article(path) for path, _ in items])
+        for (path, date), srcs in zip(items, results):
+            await self.article(path, date, srcs)
+
+    async def fetch_article(self, path: str) -> list[str | None] | None:
+        if self.pending_images(path) is not None:
+            return None
+
+        # only the image urls are kept so the page is released right away
+        async with self.semaphore:
+            res = await self.async_get(self.base_url + path, self.logger)
+            if res is None:
+                return None
+            return await self.parse(parse_article, res.text)
+
+    async def article(self, path: str, date: datetime, srcs: list[str | None] | None):
+        infos = self.pending_images(path)
+        if infos is None:
+            if srcs is None:
                 return
+            infos = self.collect_image(date, srcs)
+            self.add_article(path, date, infos)
+
+        await self.put_todo(infos)
 
-            await self.article(path, date)
+    def check_date(self, date: datetime):
+        # list dates have no time, so articles of the latest day are revisited
+        # and already recorded ones are skipped by pending_images
+        return self.latest_date > date
 
-        await self.page(page_no + 1)
 
-    async def article(self, path: str, date: datetime):
-        url = self.base_url + path
-        res = await self.async_get(url, self.logger)
-        if res is None:
-            return
-        soup = BeautifulSoup(res.text, "html.parser")
-        article = soup.find("div", {"class": "box-article"})
-        await self.crawler.put_todo(self.collect_image(date, article), self.logger)
+def parse_article(text: str) -> list[str | None]:
+    soup = make_soup(text, article_strainer)
+    article = soup.find("div", {"class": "box-article"})
+    srcs = image_srcs(article)
+    soup.decompose()
+    return srcs
 
 
 async def get_member_info(client: httpx.AsyncClient):
+    list_ = await roster_cache.get("sakura", lambda: fetch_members(client))
+
+    return attach_dates("sakura", list_)
+
+
+async def fetch_members(client: httpx.AsyncClient):
     url = base_url + "/s/s46/search/artist?display=syllabary"
-    res = await client.get(url)
-    bs4_blog = BeautifulSoup(res.text, "html.parser")
+    res = await fetch_page(client, url)
+    if res is None:
+        return []
+
+    bs4_blog = make_soup(res.text, member_strainer)
     members = bs4_blog.select(".member-elem li.box")
 
     list_ = []
@@ -86,21 +145,15 @@ async def get_member_info(client: httpx.AsyncClient):
         kana = member.find("p", {"class": "kana"}).get_text().strip()
         last = kana.split()[0]
         first = kana.split()[1]
-        first = kks.convert(first)[0]["hepburn"]
-        last = kks.convert(last)[0]["hepburn"]
+        first = roster_cache.romanize(first)
+        last = roster_cache.romanize(last)
         english = first + "_" + last
 
-        record = record_getter(code)
-        date = None
-        if record is not None:
-            date = datetime.strptime(record.get("date"), date_format)
-
         list_.append(
             {
                 "kanji_name": kanji,
                 "english_name": english,
                 "code": code,
-                "date": date,
             }
         )
 
@@ -0,0 +1,62 @@
+import json
+import os
+from datetime import datetime
+
+from src.filelock import file_lock
+from src.httpcache import cache_dir
+
+
+class DeadLetters:
+    def __init__(self, path: str = os.path.join(cache_dir, "dead_letters.jsonl")):
+        self.path = path
+
+    def add(
+        self,
+        info: dict,
+        member: tuple[str, str],
+        logger: str,
+        reason: str,
+        attempts: int,
+        status: int | None = None,
+    ) -> None:
+        # the member key and logger name let a replay join the member's lane
+        entry = {
+            "url": info["url"],
+            "path": info["path"],
+            "group": member[0],
+            "code": member[1],
+            "logger": logger,
+            "reason": reason,
+            "status": status,
+            "attempts": attempts,
+            "time": datetime.now().isoformat(timespec="seconds"),
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, mode="a", encoding="utf-8") as f, file_lock(f):
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def load(self) -> tuple[list[dict], int]:
+        if not os.path.isfile(self.path):
+            return [], 0
+
+        with open(self.path, mode="rb") as f, file_lock(f, shared=True):
+            data = f.read()
+
+        # a url that failed in several runs is only replayed once
+        entries = [json.loads(line) for line in data.splitlines() if line.strip()]
+        return list({e["path"]: e for e in entries}.values()), len(data)
+
+    def drop(self, size: int) -> None:
+        if size == 0:
+            return
+
+        # entries written while the loaded ones were replayed are kept
+        with open(self.path, mode="r+b") as f, file_lock(f):
+            f.seek(size)
+            rest = f.read()
+            f.seek(0)
+            f.write(rest)
+            f.truncate()
+
+
+dead_letters = DeadLetters()
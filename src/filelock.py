@@ -0,0 +1,27 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(f, shared: bool = False):
+    # fcntl only exists on POSIX; Windows has no shared locks, so the first
+    # byte is locked exclusively there
+    if os.name == "nt":
+        import msvcrt
+
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+
+    import fcntl
+
+    fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,85 @@
+import os
+import sqlite3
+
+import httpx
+
+from src.recorder import busy_timeout
+
+cache_dir = os.path.join(os.getcwd(), "cache")
+
+schema = """
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT
+);
+"""
+
+
+class HTTPCache:
+    def __init__(self, path: str = os.path.join(cache_dir, "http.db")) -> None:
+        self.path = path
+        self.conn: sqlite3.Connection | None = None
+        self.staged: dict[str, tuple[str | None, str | None]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.conn is not None
+
+    def configure(self, enabled: bool) -> None:
+        if not enabled:
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=busy_timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(schema)
+
+    def validators(self, url: str) -> dict[str, str]:
+        if not self.enabled:
+            return {}
+
+        row = self.conn.execute(
+            "SELECT etag, last_modified FROM validators WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return {}
+
+        headers = {}
+        if row[0]:
+            headers["If-None-Match"] = row[0]
+        if row[1]:
+            headers["If-Modified-Since"] = row[1]
+
+        return headers
+
+    def stage(self, url: str, res: httpx.Response) -> None:
+        if not self.enabled or res.status_code != 200:
+            return
+
+        etag = res.headers.get("ETag")
+        last_modified = res.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.staged[url] = (etag, last_modified)
+
+    def commit(self, urls: list[str]) -> None:
+        # only list pages are cached, and a member's pages go in one transaction
+        rows = [(url, *self.staged.pop(url)) for url in urls if url in self.staged]
+        if not rows:
+            return
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO validators VALUES (?, ?, ?)", rows
+            )
+
+    def close(self) -> None:
+        if self.enabled:
+            self.conn.close()
+
+
+def is_not_modified(res: httpx.Response | None) -> bool:
+    return res is not None and res.status_code == 304
+
+
+http_cache = HTTPCache()
@@ -0,0 +1,82 @@
+import os
+import re
+from datetime import datetime
+
+from src.blobstore import blob_store
+from src.logger import Logger
+from src.postprocess import move_derived
+from src.recorder import Recorder
+
+recorder = Recorder()
+
+layouts = ["flat", "month"]
+repatter = re.compile(r"-(\d{4})(\d{2})\d{2}\d{4}\.\w+$")
+
+
+def image_dir(member_dir: str, layout: str, date: datetime) -> str:
+    if layout == "month":
+        return os.path.join(member_dir, date.strftime("%Y"), date.strftime("%m"))
+
+    return member_dir
+
+
+def target_path(member_dir: str, path: str, layout: str) -> str | None:
+    name = os.path.basename(path)
+    result = repatter.search(name)
+    if result is None:
+        return None
+
+    date = datetime(int(result[1]), int(result[2]), 1)
+    return os.path.join(image_dir(member_dir, layout, date), name)
+
+
+def member_files(member_dir: str):
+    for root, dirs, files in os.walk(member_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if not name.endswith(".part"):
+                yield os.path.join(root, name)
+
+
+def remove_empty_dirs(member_dir: str) -> None:
+    # a year's listing is taken before its months are removed, so emptiness
+    # is checked again when the walk comes back up to it
+    for root, dirs, files in os.walk(member_dir, topdown=False):
+        if root != member_dir and not os.listdir(root):
+            os.rmdir(root)
+
+
+def migrate(base_dir: str, layout: str, logger: Logger) -> int:
+    if not os.path.isdir(base_dir):
+        return 0
+
+    moved = 0
+    for group in sorted(os.listdir(base_dir)):
+        group_dir = os.path.join(base_dir, group)
+        if group.startswith(".") or not os.path.isdir(group_dir):
+            continue
+
+        for member in sorted(os.listdir(group_dir)):
+            member_dir = os.path.join(group_dir, member)
+            if not os.path.isdir(member_dir):
+                continue
+
+            moves = []
+            for path in list(member_files(member_dir)):
+                target = target_path(member_dir, path, layout)
+                if target is None or target == path:
+                    continue
+
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+                move_derived(path, target)
+                moves.append((path, target))
+
+            recorder.move_images(moves)
+            blob_store.move_paths(dict(moves))
+            remove_empty_dirs(member_dir)
+            if moves:
+                logger.info({"migrate": f"{group}/{member}", "files": len(moves)})
+            moved += len(moves)
+
+    return moved
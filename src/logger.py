@@ -1,59 +1,117 @@
-import datetime
+import atexit
+import copy
+import json
 import os
+import queue
 from logging import (
     DEBUG,
     ERROR,
     INFO,
-    FileHandler,
     Formatter,
+    Handler,
     Logger,
+    LogRecord,
     StreamHandler,
     getLogger,
 )
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 from src.args import get_option
 
 log_dir = os.path.join(os.getcwd(), "log")
 
+formatter = Formatter(
+    "[%(levelname)-5s] %(asctime)s [%(name)s] - %(message)s [%(filename)s - %(funcName)s()] [%(processName)s]"
+)
+
+
+class JsonFormatter(Formatter):
+    def format(self, record: LogRecord) -> str:
+        message = record.msg if isinstance(record.msg, dict) else record.getMessage()
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "name": record.name,
+            "message": message,
+            "file": record.filename,
+            "func": record.funcName,
+            "process": record.processName,
+        }
+        if record.exc_text:
+            data["exception"] = record.exc_text
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LogQueueHandler(QueueHandler):
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # keep dict messages as they are so the JSON output stays structured
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if not isinstance(record.msg, dict):
+            record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+queue_handler: QueueHandler | None = None
+listener: QueueListener | None = None
+
+
+def start_listener() -> QueueHandler:
+    global queue_handler, listener
+    if queue_handler is not None:
+        return queue_handler
 
-def create_logger(name) -> Logger:
     args = get_option()
-    LOG_LEVEL = "DEBUG" if args.debug else "INFO"
+    file_formatter = JsonFormatter() if args.log_json else formatter
+    suffix = ".jsonl" if args.log_json else ".log"
 
-    formatter = Formatter(
-        "[%(levelname)-5s] %(asctime)s [%(name)s] - %(message)s [%(filename)s - %(funcName)s()] [%(processName)s]"
-    )
+    stream_handler = StreamHandler()
+    stream_handler.setLevel(DEBUG)
+    stream_handler.setFormatter(formatter)
 
-    logger = getLogger(name)
-    logger.setLevel(LOG_LEVEL)
+    handlers: list[Handler] = [stream_handler]
+    for level, name in ((INFO, "info"), (ERROR, "error")):
+        path = os.path.join(log_dir, name + suffix)
+        os.makedirs(log_dir, exist_ok=True)
+        handler = TimedRotatingFileHandler(
+            path, when="midnight", backupCount=30, encoding="utf-8"
+        )
+        handler.setLevel(level)
+        handler.setFormatter(file_formatter)
+        handlers.append(handler)
 
-    handler = StreamHandler()
-    handler.setLevel(DEBUG)
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LogQueueHandler(log_queue)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener)
 
-    info_path = get_filepath(os.path.join(log_dir, "info", name))
-    info_handler = FileHandler(info_path, encoding="utf-8")
-    info_handler.setLevel(INFO)
-    info_handler.setFormatter(formatter)
-    logger.addHandler(info_handler)
+    return queue_handler
 
-    error_path = get_filepath(os.path.join(log_dir, "error", name))
-    error_handler = FileHandler(error_path, encoding="utf-8")
-    error_handler.setLevel(ERROR)
-    error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
 
-    return logger
+def stop_listener() -> None:
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
 
 
-def get_filepath(dir):
-    today = datetime.datetime.now()
-    today_str = today.strftime("%Y%m%d.log")
+def create_logger(name) -> Logger:
+    args = get_option()
+    LOG_LEVEL = "DEBUG" if args.debug else "INFO"
 
-    if not (os.path.exists(dir)):
-        os.makedirs(dir)
+    logger = getLogger(name)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
 
-    file_path = os.path.join(dir, today_str)
+    handler = start_listener()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
 
-    return file_path
+    return logger
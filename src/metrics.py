@@ -0,0 +1,289 @@
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from src.budget import budget
+
+buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 4) if self.count else 0.0,
+            "max": round(self.max, 4),
+        }
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.json_path: str | None = None
+        self.port: int | None = None
+        self.reset()
+
+    def configure(self, json_path: str | None, port: int | None) -> None:
+        self.json_path = json_path
+        self.port = port
+
+    def reset(self) -> None:
+        self.start = time.perf_counter()
+        self.requests: dict[tuple[str, str], int] = defaultdict(int)
+        self.latency: dict[str, Histogram] = defaultdict(Histogram)
+        self.retries: dict[str, int] = defaultdict(int)
+        self.bytes: dict[str, int] = defaultdict(int)
+        self.parse: dict[str, Histogram] = defaultdict(Histogram)
+        self.queue_depth = 0
+        self.queue_max = 0
+        self.workers = 0
+        self.worker_busy = 0.0
+        self.members: dict[tuple[str, str], dict] = {}
+
+    def observe_request(self, url: str, status: int | str, seconds: float) -> None:
+        host = host_of(url)
+        self.requests[(host, str(status))] += 1
+        self.latency[host].observe(seconds)
+
+    def retry(self, url: str) -> None:
+        self.retries[host_of(url)] += 1
+
+    def add_bytes(self, url: str, size: int) -> None:
+        self.bytes[host_of(url)] += size
+
+    def observe_parse(self, name: str, seconds: float) -> None:
+        self.parse[name].observe(seconds)
+
+    def set_queue_depth(self, depth: int) -> None:
+        self.queue_depth = depth
+        self.queue_max = max(self.queue_max, depth)
+
+    def add_busy(self, seconds: float) -> None:
+        self.worker_busy += seconds
+
+    def _member(self, group: str, name: str) -> dict:
+        return self.members.setdefault(
+            (group, name), {"new": 0, "total": 0, "downloaded": 0, "bytes": 0}
+        )
+
+    def member(self, group: str, name: str, new: int, total: int) -> None:
+        entry = self._member(group, name)
+        entry["new"] = new
+        entry["total"] = total
+
+    def downloaded(self, group: str, name: str, size: int) -> None:
+        entry = self._member(group, name)
+        entry["downloaded"] += 1
+        entry["bytes"] += size
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def utilization(self) -> float:
+        capacity = self.workers * self.elapsed()
+        return self.worker_busy / capacity if capacity else 0.0
+
+    def memory(self) -> dict:
+        data: dict = {}
+        rss = peak_rss()
+        if rss is not None:
+            data["peak rss bytes"] = rss
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            data["traced bytes"] = current
+            data["traced peak bytes"] = peak
+        if budget.enabled:
+            data["budget"] = {
+                "limit": budget.limit,
+                "in use": budget.used,
+                "peak": budget.peak,
+            }
+
+        return data
+
+    def top_allocations(self, count: int = 10) -> list[str]:
+        if not tracemalloc.is_tracing():
+            return []
+
+        stats = tracemalloc.take_snapshot().statistics("lineno")
+        return [str(stat) for stat in stats[:count]]
+
+    def summary(self) -> dict:
+        hosts: dict[str, dict] = {}
+        for (host, status), count in sorted(self.requests.items()):
+            entry = hosts.setdefault(
+                host,
+                {
+                    "status": {},
+                    "latency": self.latency[host].summary(),
+                    "retries": self.retries.get(host, 0),
+                    "bytes": self.bytes.get(host, 0),
+                },
+            )
+            entry["status"][status] = count
+
+        groups: dict[str, dict] = {}
+        members: dict[str, dict] = {}
+        for (group, name), entry in sorted(self.members.items()):
+            members[f"{group}/{name}"] = entry
+            total = groups.setdefault(
+                group, {"new": 0, "total": 0, "downloaded": 0, "bytes": 0}
+            )
+            for key in total:
+                total[key] += entry[key]
+
+        return {
+            "elapsed": round(self.elapsed(), 3),
+            "hosts": hosts,
+            "queue": {"depth": self.queue_depth, "max depth": self.queue_max},
+            "workers": {
+                "count": self.workers,
+                "busy seconds": round(self.worker_busy, 3),
+                "utilization": round(self.utilization(), 3),
+            },
+            "parse": {name: h.summary() for name, h in sorted(self.parse.items())},
+            "memory": self.memory(),
+            "groups": groups,
+            "members": members,
+        }
+
+    def dump_json(self) -> None:
+        if self.json_path is None:
+            return
+
+        with open(self.json_path, mode="w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=4, ensure_ascii=False)
+
+    def prometheus(self) -> str:
+        lines = [
+            "# TYPE crawler_requests_total counter",
+            *(
+                f'crawler_requests_total{{host="{h}",status="{s}"}} {c}'
+                for (h, s), c in sorted(self.requests.items())
+            ),
+            "# TYPE crawler_request_seconds histogram",
+        ]
+        for host, hist in sorted(self.latency.items()):
+            cumulative = 0
+            for bound, count in zip(buckets, hist.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(
+                    f'crawler_request_seconds_bucket{{host="{host}",le="{le}"}} {cumulative}'
+                )
+            lines.append(f'crawler_request_seconds_sum{{host="{host}"}} {hist.sum}')
+            lines.append(f'crawler_request_seconds_count{{host="{host}"}} {hist.count}')
+
+        lines.append("# TYPE crawler_retries_total counter")
+        lines += [
+            f'crawler_retries_total{{host="{h}"}} {c}'
+            for h, c in sorted(self.retries.items())
+        ]
+        lines.append("# TYPE crawler_bytes_total counter")
+        lines += [
+            f'crawler_bytes_total{{host="{h}"}} {c}'
+            for h, c in sorted(self.bytes.items())
+        ]
+        lines.append("# TYPE crawler_parse_seconds summary")
+        for name, hist in sorted(self.parse.items()):
+            lines.append(f'crawler_parse_seconds_sum{{func="{name}"}} {hist.sum}')
+            lines.append(f'crawler_parse_seconds_count{{func="{name}"}} {hist.count}')
+
+        lines += [
+            "# TYPE crawler_queue_depth gauge",
+            f"crawler_queue_depth {self.queue_depth}",
+            "# TYPE crawler_worker_utilization gauge",
+            f"crawler_worker_utilization {self.utilization()}",
+        ]
+        memory = self.memory()
+        if "peak rss bytes" in memory:
+            lines += [
+                "# TYPE crawler_peak_rss_bytes gauge",
+                f"crawler_peak_rss_bytes {memory['peak rss bytes']}",
+            ]
+        if "traced bytes" in memory:
+            lines += [
+                "# TYPE crawler_traced_bytes gauge",
+                f"crawler_traced_bytes {memory['traced bytes']}",
+            ]
+        if budget.enabled:
+            lines += [
+                "# TYPE crawler_budget_bytes gauge",
+                f"crawler_budget_bytes {budget.used}",
+            ]
+
+        lines.append("# TYPE crawler_member_images_total counter")
+        for (group, name), entry in sorted(self.members.items()):
+            lines.append(
+                f'crawler_member_images_total{{group="{group}",member="{name}"}} {entry["downloaded"]}'
+            )
+
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = self.prometheus().encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    @asynccontextmanager
+    async def serving(self):
+        if self.port is None:
+            yield
+            return
+
+        server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+        try:
+            yield
+        finally:
+            server.close()
+            await server.wait_closed()
+
+
+def peak_rss() -> int | None:
+    # resource only exists on POSIX
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+
+metrics = Metrics()
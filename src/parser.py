@@ -0,0 +1,46 @@
+from importlib.util import find_spec
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+backends = ["lxml", "html.parser"]
+
+
+def detect_backend() -> str:
+    if find_spec("lxml") is not None:
+        return "lxml"
+
+    return "html.parser"
+
+
+backend = detect_backend()
+
+
+def configure(name: str | None) -> None:
+    global backend
+    if name is None or name == "auto":
+        backend = detect_backend()
+    elif name in backends:
+        backend = name
+    else:
+        raise ValueError(f"unknown parser : {name}")
+
+
+def make_soup(markup: str, only: SoupStrainer | None = None) -> BeautifulSoup:
+    return BeautifulSoup(markup, backend, parse_only=only)
+
+
+def has_class(name: str):
+    def match(value) -> bool:
+        if value is None:
+            return False
+        values = value.split() if isinstance(value, str) else value
+        return name in values
+
+    return match
+
+
+def strainer(tag: str | None = None, class_: str | None = None) -> SoupStrainer:
+    if class_ is None:
+        return SoupStrainer(tag)
+
+    return SoupStrainer(tag, class_=has_class(class_))
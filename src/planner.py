@@ -0,0 +1,81 @@
+import asyncio
+from contextlib import nullcontext
+
+import httpx
+
+from src.crawler import hinata, nogi, sakura
+from src.recorder import date_format
+from src.workstore import holding, owner_id
+
+modules = {"nogi": nogi, "sakura": sakura, "hinata": hinata}
+
+
+def selected_groups(args) -> list[str]:
+    groups = [group for group in modules if getattr(args, group)]
+    return groups or list(modules)
+
+
+def match_member(info: dict, member: str | None) -> bool:
+    if member is None:
+        return True
+
+    return (
+        member in info["kanji_name"]
+        or member.lower() in info["english_name"].lower()
+        or member == info["code"]
+    )
+
+
+async def plan(client: httpx.AsyncClient, args) -> list[tuple[str, dict]]:
+    groups = selected_groups(args)
+    infos = await asyncio.gather(
+        *[modules[group].get_member_info(client) for group in groups]
+    )
+
+    return [
+        (group, info)
+        for group, list_ in zip(groups, infos)
+        for info in list_
+        if match_member(info, args.member)
+    ]
+
+
+async def run_collectors(
+    planned: list[tuple[str, dict]],
+    client,
+    crawler,
+    store=None,
+    run_id: str | None = None,
+    limit: int | None = None,
+    lease: float = 300.0,
+) -> list:
+    semaphore = asyncio.Semaphore(limit) if limit else nullcontext()
+    owner = owner_id()
+    collectors = []
+
+    # members are claimed only when there is room to crawl them, so shards
+    # that finish early pick up the rest of the list
+    async def run_one(group: str, info: dict) -> None:
+        async with semaphore:
+            claim = (run_id, group, info["code"], owner)
+            if store is not None and not store.claim(*claim, lease):
+                return
+
+            async with holding(store, claim, lease) if store else nullcontext():
+                collector = modules[group].Collector(
+                    client=client, crawler=crawler, **info
+                )
+                collectors.append(collector)
+                await collector.run()
+
+    await asyncio.gather(*[run_one(group, info) for group, info in planned])
+    return collectors
+
+
+def print_plan(planned: list[tuple[str, dict]]) -> None:
+    for group, info in planned:
+        date = info["date"].strftime(date_format) if info["date"] else "-"
+        print(
+            f"{group:<7} {info['code']:>6}  {date:<19}  {info['english_name']} ({info['kanji_name']})"
+        )
+    print(f"{len(planned)} members")
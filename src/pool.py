@@ -0,0 +1,36 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from src import parser
+
+
+class ParsePool:
+    def __init__(self) -> None:
+        self.executor: ProcessPoolExecutor | None = None
+
+    def configure(self, processes: int) -> None:
+        if processes <= 0:
+            return
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=parser.configure,
+            initargs=(parser.backend,),
+        )
+        # start the workers now, before the event loop creates any threads
+        self.executor.submit(int).result()
+
+    async def run(self, func, *args):
+        if self.executor is None:
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+parse_pool = ParsePool()
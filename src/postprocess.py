@@ -0,0 +1,191 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import find_spec
+
+from src.logger import Logger
+
+data_dir = os.path.join(os.getcwd(), "data")
+derived_dir = os.path.join(os.getcwd(), "derived")
+
+background_size = (1920, 1080)
+quality = {"thumb": 85, "background": 85, "webp": 80, "avif": 60}
+
+
+def derived_path(kind: str, path: str) -> str:
+    ext = ".jpg" if kind in ("thumb", "background") else "." + kind
+    name = os.path.splitext(os.path.relpath(path, data_dir))[0]
+    return os.path.join(derived_dir, kind, name + ext)
+
+
+def move_derived(path: str, target: str) -> None:
+    for kind in ("thumb", "background", "webp", "avif"):
+        src = derived_path(kind, path)
+        if os.path.exists(src):
+            dst = derived_path(kind, target)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.replace(src, dst)
+
+
+def existing_images() -> list[str]:
+    paths = []
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        paths += [
+            os.path.join(root, n) for n in sorted(files) if not n.endswith(".part")
+        ]
+
+    return paths
+
+
+def is_fresh(path: str, dst: str) -> bool:
+    return os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(path)
+
+
+def make_background(image, size: tuple[int, int]):
+    from PIL import ImageFilter, ImageOps
+
+    canvas = ImageOps.fit(image, size).filter(ImageFilter.GaussianBlur(40))
+    front = ImageOps.contain(image, size)
+    canvas.paste(front, ((size[0] - front.width) // 2, (size[1] - front.height) // 2))
+    return canvas
+
+
+def process_image(
+    path: str, thumbnail: int | None, kinds: list[str], background: bool
+) -> list[str]:
+    from PIL import Image, ImageOps
+
+    kinds = (["thumb"] if thumbnail else []) + kinds
+    kinds += ["background"] if background else []
+    todo = [(k, derived_path(k, path)) for k in kinds]
+    todo = [(k, dst) for k, dst in todo if not is_fresh(path, dst)]
+    if not todo:
+        return []
+
+    with Image.open(path) as opened:
+        image = ImageOps.exif_transpose(opened).convert("RGB")
+
+    for kind, dst in todo:
+        if kind == "thumb":
+            out = image.copy()
+            out.thumbnail((thumbnail, thumbnail))
+        elif kind == "background":
+            out = make_background(image, background_size)
+        else:
+            out = image
+
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp_path = dst + ".part"
+        out.save(
+            tmp_path,
+            format="JPEG" if dst.endswith(".jpg") else kind.upper(),
+            quality=quality[kind],
+        )
+        os.replace(tmp_path, dst)
+
+    return [dst for _, dst in todo]
+
+
+class PostProcessor:
+    def __init__(self) -> None:
+        self.thumbnail: int | None = None
+        self.formats: list[str] = []
+        self.background = False
+        self.processes = 2
+        self.executor: ProcessPoolExecutor | None = None
+        self.queue: asyncio.Queue | None = None
+        self.tasks: list[asyncio.Task] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.thumbnail or self.formats or self.background)
+
+    def configure(
+        self,
+        thumbnail: int | None,
+        formats: list[str] | None,
+        background: bool,
+        processes: int,
+    ) -> None:
+        self.close()
+        self.thumbnail = thumbnail
+        self.formats = formats or []
+        self.background = background
+        self.processes = max(1, processes)
+        if not self.enabled:
+            return
+        if find_spec("PIL") is None:
+            raise ValueError("image processing requires Pillow")
+        # AVIF needs a Pillow built with libavif, which is found out here
+        # rather than on every image the workers save
+        from PIL import Image
+
+        Image.init()
+        missing = [f for f in self.formats if f.upper() not in Image.SAVE]
+        if missing:
+            raise ValueError(f"this Pillow cannot save {', '.join(missing)}")
+
+        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+        # start the workers now, before the event loop creates any threads
+        self.executor.submit(int).result()
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+
+        # paths are queued without bound so downloads never wait on images
+        # being processed; only `processes` images are in flight at a time
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._feed()) for _ in range(self.processes)]
+
+    def submit(self, path: str, logger: Logger) -> None:
+        if self.queue is not None:
+            self.queue.put_nowait((path, logger))
+
+    async def submit_existing(self, logger: Logger) -> int:
+        paths = await asyncio.to_thread(existing_images)
+        for path in paths:
+            self.submit(path, logger)
+
+        return len(paths)
+
+    async def _feed(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            path, logger = await self.queue.get()
+            try:
+                made = await loop.run_in_executor(
+                    self.executor,
+                    process_image,
+                    path,
+                    self.thumbnail,
+                    self.formats,
+                    self.background,
+                )
+                if made:
+                    logger.debug({"processed": path, "files": len(made)})
+            except Exception as e:
+                logger.error({"process": path, "Exception": e})
+            finally:
+                self.queue.task_done()
+
+    async def stop(self, drain: bool = True) -> None:
+        if self.queue is None:
+            return
+
+        if drain:
+            await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.queue = None
+        self.tasks = []
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
+post_processor = PostProcessor()
@@ -0,0 +1,152 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import httpx
+
+group_hosts = {
+    "nogi": "nogizaka46.com",
+    "sakura": "sakurazaka46.com",
+    "hinata": "hinatazaka46.com",
+}
+
+# 20 download workers each waited 0.5s per request before there was a limiter
+default_rate = 40.0
+throttle_status = (429, 503)
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate: float,
+        burst: float = 1.0,
+        increase: float = 0.025,
+        decrease: float = 0.5,
+        min_rate: float = 0.025,
+    ):
+        # the additive step and the floor are fractions of the configured
+        # rate, so a fast host recovers as quickly as a slow one
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.increase = rate * increase
+        self.decrease = decrease
+        self.min_rate = rate * min_rate
+
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after: float | None = None) -> None:
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = 0
+        if retry_after is not None:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+class RateLimiter:
+    def __init__(self) -> None:
+        self.rates: dict[str, float] = {}
+        self.default_rate = default_rate
+        self.shares = 1
+        self.buckets: dict[str, TokenBucket] = {}
+
+    def configure(
+        self,
+        rates: dict[str, float],
+        default: float | None = None,
+        shares: int = 1,
+    ):
+        self.rates = rates
+        if default is not None:
+            self.default_rate = default
+        # rates are for the whole crawl, each of `shares` processes gets a part
+        self.shares = max(1, shares)
+        self.buckets = {}
+
+    def rate_for(self, host: str) -> float:
+        rate = self.default_rate
+        for group, suffix in group_hosts.items():
+            if host == suffix or host.endswith("." + suffix):
+                rate = self.rates.get(group, self.default_rate)
+                break
+
+        return rate / self.shares
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).hostname or ""
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_for(host))
+            self.buckets[host] = bucket
+
+        return bucket
+
+    async def acquire(self, url: str) -> None:
+        await self.bucket(url).acquire()
+
+    def feedback(self, url: str, res: httpx.Response) -> None:
+        bucket = self.bucket(url)
+        if res.status_code in throttle_status:
+            bucket.on_throttle(parse_retry_after(res.headers.get("Retry-After")))
+        else:
+            bucket.on_success()
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if value is None:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def parse_rates(values: list[str] | None) -> dict[str, float]:
+    rates: dict[str, float] = {}
+    for value in values or []:
+        group, _, rate = value.partition("=")
+        if group not in group_hosts or rate == "":
+            raise ValueError(f"invalid rate : {value}")
+        rates[group] = float(rate)
+
+    return rates
+
+
+limiter = RateLimiter()
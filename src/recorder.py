@@ -1,7 +1,54 @@
 import json
 import os
+import sqlite3
+from datetime import datetime
 
 date_format = "%Y/%m/%d %H:%M:%S"
+# seconds to wait for another shard's write transaction to finish
+busy_timeout = 60.0
+
+schema = """
+CREATE TABLE IF NOT EXISTS members (
+    grp TEXT NOT NULL,
+    code TEXT NOT NULL,
+    name TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    date TEXT NOT NULL,
+    PRIMARY KEY (grp, code)
+);
+CREATE TABLE IF NOT EXISTS articles (
+    grp TEXT NOT NULL,
+    code TEXT NOT NULL,
+    key TEXT NOT NULL,
+    date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (grp, code, key)
+);
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    code TEXT NOT NULL,
+    article TEXT NOT NULL,
+    day TEXT NOT NULL,
+    size INTEGER,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    grp TEXT NOT NULL,
+    code TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    PRIMARY KEY (grp, code)
+);
+CREATE TABLE IF NOT EXISTS totals (
+    grp TEXT NOT NULL,
+    code TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    PRIMARY KEY (grp, code)
+);
+CREATE INDEX IF NOT EXISTS images_article ON images (grp, code, article);
+CREATE INDEX IF NOT EXISTS images_day ON images (grp, code, day);
+"""
 
 
 class Singleton:
@@ -14,46 +61,219 @@ class Singleton:
 
 
 class Recorder(Singleton):
+    conn: sqlite3.Connection | None = None
+
+    file_name = "record.db"
+    json_name = "record.json"
+    groups = ("nogi", "sakura", "hinata")
+
     def __init__(self) -> None:
-        self.file_name = "record.json"
+        self.open()
+
+    def open(self) -> None:
+        if self.conn is not None:
+            return
+
+        self.conn = sqlite3.connect(self.file_name, timeout=busy_timeout)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(schema)
+        self._migrate_json()
 
-        self.record: dict = self._load_json()
+    def _migrate_json(self) -> None:
+        if not os.path.isfile(self.json_name):
+            return
+        if self.conn.execute("SELECT 1 FROM members LIMIT 1").fetchone():
+            return
 
-    def _load_json(self) -> dict:
-        data: dict = {"nogi": {}, "sakura": {}, "hinata": {}}
-        if os.path.isfile(self.file_name):
-            with open(self.file_name, encoding="utf-8") as f:
-                data = json.load(f)
+        with open(self.json_name, encoding="utf-8") as f:
+            data: dict = json.load(f)
 
-        return data
+        with self.conn:
+            for group, members in data.items():
+                for code, record in members.items():
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?)",
+                        (group, code, record["name"], record["total"], record["date"]),
+                    )
+
+        os.replace(self.json_name, self.json_name + ".migrated")
 
     def call_getter(self, group: str):
-        if self.record.get(group) is not None:
+        if group in self.groups:
 
             def getter(code: str):
                 return self._getter(group, code)
 
             return getter
         else:
-            raise
+            raise ValueError(f"unknown group : {group}")
 
     def _getter(self, group: str, code: str) -> dict | None:
-        return self.record[group].get(code)
+        row = self.conn.execute(
+            "SELECT name, COALESCE(files, total) AS total, date FROM members"
+            " LEFT JOIN totals USING (grp, code) WHERE grp = ? AND code = ?",
+            (group, code),
+        ).fetchone()
+        if row is None:
+            return None
+
+        return dict(row)
 
-    def dump_json(self) -> None:
-        self.sort_record()
-        with open(self.file_name, mode="w", encoding="utf-8") as f:
-            json.dump(
-                self.record,
-                f,
-                indent=4,
-                ensure_ascii=False,
+    def update_member(
+        self, group: str, code: str, name: str, total: int, date: datetime
+    ) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?)",
+                (group, code, name, total, date.strftime(date_format)),
             )
 
-    def sort_record(self):
-        self.record["nogi"] = self.sort_by_code(self.record["nogi"])
-        self.record["sakura"] = self.sort_by_code(self.record["sakura"])
-        self.record["hinata"] = self.sort_by_code(self.record["hinata"])
+    def newest_article(self, group: str, code: str) -> datetime | None:
+        row = self.conn.execute(
+            "SELECT MAX(date) FROM articles WHERE grp = ? AND code = ?",
+            (group, code),
+        ).fetchone()
+        if row[0] is None:
+            return None
+
+        return datetime.strptime(row[0], date_format)
+
+    def article_dates(self, group: str, code: str, limit: int = 10) -> list[datetime]:
+        rows = self.conn.execute(
+            "SELECT date FROM articles WHERE grp = ? AND code = ?"
+            " ORDER BY date DESC LIMIT ?",
+            (group, code, limit),
+        ).fetchall()
+
+        return [datetime.strptime(row[0], date_format) for row in rows]
+
+    def add_article(
+        self, group: str, code: str, key: str, date: datetime, infos: list[dict]
+    ) -> None:
+        day = date.strftime("%Y%m%d")
+        status = "pending" if infos else "done"
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?)",
+                (group, code, key, date.strftime(date_format), status),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO images VALUES (?, ?, ?, ?, ?, ?, NULL, 'pending')",
+                [(i["path"], i["url"], group, code, key, day) for i in infos],
+            )
+
+    def pending_images(self, group: str, code: str, key: str) -> list[dict] | None:
+        row = self.conn.execute(
+            "SELECT status FROM articles WHERE grp = ? AND code = ? AND key = ?",
+            (group, code, key),
+        ).fetchone()
+        if row is None:
+            return None
+        if row["status"] == "done":
+            return []
+
+        rows = self.conn.execute(
+            "SELECT url, path FROM images"
+            " WHERE grp = ? AND code = ? AND article = ? AND status != 'done'",
+            (group, code, key),
+        ).fetchall()
+
+        return [dict(r) for r in rows]
+
+    def count_day_images(self, group: str, code: str, date: datetime) -> int:
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM images WHERE grp = ? AND code = ? AND day = ?",
+            (group, code, date.strftime("%Y%m%d")),
+        ).fetchone()
+
+        return row[0]
+
+    def image_done(self, path: str, size: int) -> None:
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE images SET size = ?, status = 'done'"
+                " WHERE path = ? AND status != 'done'",
+                (size, path),
+            )
+            if cur.rowcount:
+                self.conn.execute(
+                    "UPDATE totals SET files = files + 1 WHERE (grp, code) = "
+                    "(SELECT grp, code FROM images WHERE path = ?)",
+                    (path,),
+                )
+            self.conn.execute(
+                "UPDATE articles SET status = 'done'"
+                " WHERE (grp, code, key) = "
+                "(SELECT grp, code, article FROM images WHERE path = ?)"
+                " AND NOT EXISTS (SELECT 1 FROM images"
+                " WHERE grp = articles.grp AND code = articles.code"
+                " AND article = articles.key AND status != 'done')",
+                (path,),
+            )
+
+    def image_failed(self, path: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE images SET status = 'failed' WHERE path = ?", (path,)
+            )
+
+    def seed_total(self, group: str, code: str) -> None:
+        # the first count comes from the last listing of the member's directory
+        # or from the finished downloads, whichever knows more files
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO totals SELECT ?, ?, MAX("
+                "COALESCE((SELECT total FROM members WHERE grp = ? AND code = ?), 0),"
+                " (SELECT COUNT(*) FROM images"
+                " WHERE grp = ? AND code = ? AND status = 'done'))",
+                (group, code) * 3,
+            )
+
+    def file_total(self, group: str, code: str) -> int:
+        row = self.conn.execute(
+            "SELECT files FROM totals WHERE grp = ? AND code = ?", (group, code)
+        ).fetchone()
+
+        return 0 if row is None else row[0]
+
+    def move_images(self, moves: list[tuple[str, str]]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE images SET path = ? WHERE path = ?",
+                [(new, old) for old, new in moves],
+            )
+
+    def pending_downloads(self, group: str, code: str) -> list[dict]:
+        rows = self.conn.execute(
+            "SELECT url, path FROM images"
+            " WHERE grp = ? AND code = ? AND status != 'done' ORDER BY path",
+            (group, code),
+        ).fetchall()
+
+        return [dict(r) for r in rows]
+
+    def get_cursor(self, group: str, code: str) -> int | None:
+        row = self.conn.execute(
+            "SELECT page FROM cursors WHERE grp = ? AND code = ?", (group, code)
+        ).fetchone()
+
+        return None if row is None else row[0]
+
+    def save_cursor(self, group: str, code: str, page: int) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cursors VALUES (?, ?, ?)", (group, code, page)
+            )
+
+    def clear_cursor(self, group: str, code: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM cursors WHERE grp = ? AND code = ?", (group, code)
+            )
 
-    def sort_by_code(self, d: dict):
-        return dict(sorted(d.items(), key=lambda x: int(x[0])))
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
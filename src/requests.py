@@ -1,29 +1,51 @@
 import asyncio
+import hashlib
+import os
+import random
+import time
+from typing import Awaitable, Callable
 
 import httpx
 
+from .budget import budget
+from .httpcache import http_cache
 from .logger import Logger
+from .metrics import metrics
+from .ratelimit import limiter
 
 
 def create_get_req(
     client: httpx.AsyncClient,
     interval: int = 3,
-    timeout: float = 5.0,
 ):
     async def async_get(
         url: str,
         logger: Logger,
         headers: dict[str, str] = {},
         worker: int | None = None,
+        conditional: bool = False,
     ):
         logger.debug({"request": url, "worker": worker})
-        await asyncio.sleep(0.5)
-        for _ in range(3):
+        if conditional:
+            headers = {**headers, **http_cache.validators(url)}
+
+        for attempt in range(3):
+            if attempt > 0:
+                metrics.retry(url)
+            start = time.perf_counter()
             try:
-                res = await client.get(
-                    url, headers=headers, timeout=timeout, follow_redirects=True
+                await limiter.acquire(url)
+                start = time.perf_counter()
+                res = await client.get(url, headers=headers, follow_redirects=True)
+                metrics.observe_request(
+                    url, res.status_code, time.perf_counter() - start
                 )
+                limiter.feedback(url, res)
                 if res.status_code == 200:
+                    if conditional:
+                        http_cache.stage(url, res)
+                    return res
+                if res.status_code == 304:
                     return res
 
                 logger.error(
@@ -38,9 +60,226 @@ def create_get_req(
                     return None
 
             except Exception as e:
+                metrics.observe_request(url, "error", time.perf_counter() - start)
                 logger.error({"url": url, "Exception": e, "worker": worker})
-                await asyncio.sleep(interval)
+                await asyncio.sleep(backoff(attempt, interval))
 
         return None
 
     return async_get
+
+
+def backoff(attempt: int, delay: float, cap: float = 300.0) -> float:
+    # jittered so that requests failing in the same burst do not retry together
+    ceiling = min(cap, delay * 2**attempt)
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class IntegrityError(Exception):
+    pass
+
+
+class StatusError(Exception):
+    def __init__(self, status: int) -> None:
+        super().__init__(f"status code {status}")
+        self.status = status
+
+
+def is_permanent(status: int | None) -> bool:
+    # client errors other than timeouts and throttling will not go away
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+def create_download_req(
+    client: httpx.AsyncClient,
+    upload: Callable[[httpx.Response, str, int | None], Awaitable[int]],
+    partial: Callable[[str], int],
+    discard: Callable[[str], None],
+    chunk_size: int = 64 * 1024,
+):
+    # one attempt per call so the caller decides when to try again; `resume`
+    # keeps the If-Range validator of the partial body between attempts
+    async def async_download(
+        url: str,
+        path: str,
+        logger: Logger,
+        headers: dict[str, str] = {},
+        worker: int | None = None,
+        resume: dict[str, str] | None = None,
+    ) -> int | None:
+        logger.debug({"download": url, "worker": worker})
+        if resume is None:
+            resume = {}
+        offset = await asyncio.to_thread(partial, path) if resume else 0
+        if offset:
+            headers = {**headers, **resume, "Range": f"bytes={offset}-"}
+            logger.debug({"resume": url, "offset": offset, "worker": worker})
+        start = time.perf_counter()
+        try:
+            await limiter.acquire(url)
+            start = time.perf_counter()
+            async with client.stream(
+                "GET", url, headers=headers, follow_redirects=True
+            ) as res:
+                metrics.observe_request(
+                    url, res.status_code, time.perf_counter() - start
+                )
+                limiter.feedback(url, res)
+                if res.status_code == 404:
+                    logger.error(
+                        {"url": url, "status code": res.status_code, "worker": worker}
+                    )
+                    await asyncio.to_thread(discard, path)
+                    return None
+                if res.status_code not in (200, 206):
+                    raise StatusError(res.status_code)
+
+                if res.status_code == 200:
+                    offset = 0
+                elif range_start(res) != offset:
+                    raise IntegrityError(f"unexpected range from {offset}")
+                resume.clear()
+                resume.update(resume_validator(res))
+                expected = expected_size(res)
+                # the body is only read once its bytes fit in the budget; a
+                # resumed body of unknown size still holds at least a chunk
+                remaining = max((expected or chunk_size) - offset, chunk_size)
+                async with budget.hold(remaining):
+                    size = await upload(res, path, expected)
+                metrics.add_bytes(url, size - offset)
+                return size
+
+        except asyncio.CancelledError:
+            discard(path)
+            raise
+        except IntegrityError as e:
+            metrics.observe_request(url, "invalid", time.perf_counter() - start)
+            logger.error({"url": url, "integrity": str(e), "worker": worker})
+            resume.clear()
+            await asyncio.to_thread(discard, path)
+            raise
+        except Exception as e:
+            if not isinstance(e, StatusError):
+                metrics.observe_request(url, "error", time.perf_counter() - start)
+            logger.error({"url": url, "Exception": e, "worker": worker})
+            if not resume:
+                await asyncio.to_thread(discard, path)
+            raise
+
+    return async_download
+
+
+def requested_url(res: httpx.Response) -> str:
+    # the url before any redirect, which is what the image was queued with
+    first = res.history[0] if res.history else res
+    return str(first.request.url)
+
+
+def resume_validator(res: httpx.Response) -> dict[str, str]:
+    if res.headers.get("Accept-Ranges") != "bytes":
+        return {}
+
+    # If-Range only accepts strong validators
+    etag = res.headers.get("ETag")
+    if etag is not None and not etag.startswith("W/"):
+        return {"If-Range": etag}
+    last_modified = res.headers.get("Last-Modified")
+    if last_modified is not None:
+        return {"If-Range": last_modified}
+
+    return {}
+
+
+def range_start(res: httpx.Response) -> int | None:
+    unit, _, spec = res.headers.get("Content-Range", "").partition(" ")
+    first = spec.partition("-")[0]
+    if unit != "bytes" or not first.isdigit():
+        return None
+
+    return int(first)
+
+
+def expected_size(res: httpx.Response) -> int | None:
+    # decoded bodies do not match the transferred length
+    if res.headers.get("Content-Encoding", "identity") != "identity":
+        return None
+
+    if res.status_code == 206:
+        total = res.headers.get("Content-Range", "").rpartition("/")[2]
+    else:
+        total = res.headers.get("Content-Length", "")
+
+    return int(total) if total.isdigit() else None
+
+
+jpeg_magic = b"\xff\xd8"
+jpeg_end = b"\xff\xd9"
+png_magic = b"\x89PNG\r\n\x1a\n"
+png_end = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+
+def verify_file(path: str, size: int, expected: int | None) -> None:
+    with open(path, "rb") as f:
+        head = f.read(8)
+        f.seek(max(0, size - 32))
+        tail = f.read()
+
+    verify_bytes(head, tail, size, expected)
+
+
+def verify_bytes(head: bytes, tail: bytes, size: int, expected: int | None) -> None:
+    if expected is not None and size != expected:
+        raise IntegrityError(f"{size} bytes of {expected}")
+
+    # encoders may pad after the end marker
+    if head.startswith(jpeg_magic) and not tail.rstrip(b"\x00\r\n ").endswith(jpeg_end):
+        raise IntegrityError("missing JPEG end marker")
+    if head.startswith(png_magic) and not tail.endswith(png_end):
+        raise IntegrityError("missing PNG IEND chunk")
+
+
+async def write_stream(
+    res: httpx.Response, path: str, chunk_size: int, offset: int = 0
+) -> tuple[int, str]:
+    size = offset
+    hash = hashlib.sha256()
+    if offset:
+        await asyncio.to_thread(hash_file, path, hash)
+    f = await asyncio.to_thread(open, path, "ab" if offset else "wb")
+    try:
+        async for chunk in res.aiter_bytes(chunk_size):
+            await asyncio.to_thread(write_chunk, f, hash, chunk)
+            size += len(chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+
+    return size, hash.hexdigest()
+
+
+def hash_file(path: str, hash) -> None:
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            hash.update(chunk)
+
+
+def file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def write_chunk(f, hash, chunk: bytes) -> None:
+    f.write(chunk)
+    hash.update(chunk)
+
+
+def replace_file(tmp_path: str, path: str, url: str, digest: str) -> None:
+    os.replace(tmp_path, path)
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
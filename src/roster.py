@@ -0,0 +1,107 @@
+import json
+import os
+import time
+from datetime import datetime
+from functools import cache
+from typing import Awaitable, Callable
+
+import httpx
+
+from src.httpcache import cache_dir
+from src.logger import create_logger
+from src.recorder import Recorder, date_format
+from src.requests import create_get_req
+
+recorder = Recorder()
+logger = create_logger("roster")
+
+
+@cache
+def get_kakasi():
+    from pykakasi import kakasi
+
+    return kakasi()
+
+
+class RosterCache:
+    def __init__(self, path: str = os.path.join(cache_dir, "roster.json")) -> None:
+        self.path = path
+        self.ttl: float = 0
+        self.data: dict = {"groups": {}, "names": {}}
+        self.loaded = False
+
+    def configure(self, ttl: float) -> None:
+        self.ttl = ttl
+
+    def _load(self) -> None:
+        if self.loaded:
+            return
+
+        self.loaded = True
+        if os.path.isfile(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def _dump(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.part"
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    async def get(
+        self, group: str, fetch: Callable[[], Awaitable[list[dict]]]
+    ) -> list[dict]:
+        self._load()
+        cached = self.data["groups"].get(group)
+        if cached is not None and time.time() - cached["fetched"] < self.ttl:
+            return cached["members"]
+
+        try:
+            members = await fetch()
+        except Exception as e:
+            if cached is None:
+                raise
+            logger.warning({"message": "use cached roster", "group": group, "error": e})
+            return cached["members"]
+
+        if not members:
+            if cached is None:
+                return []
+            logger.warning({"message": "use cached roster", "group": group})
+            return cached["members"]
+
+        self.data["groups"][group] = {"fetched": time.time(), "members": members}
+        self._dump()
+        return members
+
+    def romanize(self, kana: str) -> str:
+        self._load()
+        names: dict = self.data["names"]
+        if kana not in names:
+            names[kana] = get_kakasi().convert(kana)[0]["hepburn"]
+
+        return names[kana]
+
+
+async def fetch_page(client: httpx.AsyncClient, url: str) -> httpx.Response | None:
+    # retried and rate limited like the list pages; None leaves the cached roster
+    return await create_get_req(client)(url, logger)
+
+
+def attach_dates(group: str, members: list[dict]) -> list[dict]:
+    record_getter = recorder.call_getter(group)
+
+    list_ = []
+    for member in members:
+        record = record_getter(member["code"])
+        date = None
+        if record is not None:
+            date = datetime.strptime(record.get("date"), date_format)
+
+        list_.append({**member, "date": date})
+
+    return list_
+
+
+roster_cache = RosterCache()
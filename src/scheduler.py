@@ -0,0 +1,91 @@
+import asyncio
+from collections import defaultdict, deque
+from typing import Any
+
+fresh = 0
+backfill = 1
+priorities = (fresh, backfill)
+
+
+class Scheduler:
+    def __init__(self, capacity: int, group_limits: dict[str, int] | None = None):
+        self.capacity = capacity
+        self.group_limits = group_limits or {}
+
+        # priority -> group rotation -> member rotation -> items, so a member
+        # with a long backlog only ever gets its turn within its own group
+        self.items: dict[tuple[int, str, str], deque] = defaultdict(deque)
+        self.members: list[dict[str, deque[str]]] = [{} for _ in priorities]
+        self.groups: list[deque[str]] = [deque() for _ in priorities]
+        self.active: dict[str, int] = defaultdict(int)
+        self.size = 0
+        self.unfinished = 0
+        self.changed = asyncio.Condition()
+
+    def qsize(self) -> int:
+        return self.size
+
+    def pending(self, group: str, code: str) -> int:
+        return sum(len(self.items.get((p, group, code), ())) for p in priorities)
+
+    async def put(self, group: str, code: str, item: Any, priority: int = fresh):
+        async with self.changed:
+            await self.changed.wait_for(
+                lambda: self.pending(group, code) < self.capacity
+            )
+            queue = self.items[(priority, group, code)]
+            if not queue:
+                codes = self.members[priority].setdefault(group, deque())
+                if not codes:
+                    self.groups[priority].append(group)
+                codes.append(code)
+
+            queue.append(item)
+            self.size += 1
+            self.unfinished += 1
+            self.changed.notify_all()
+
+    def _pop(self) -> tuple[str, Any] | None:
+        for priority, groups in enumerate(self.groups):
+            for _ in range(len(groups)):
+                group = groups[0]
+                groups.rotate(-1)
+                limit = self.group_limits.get(group)
+                if limit is not None and self.active[group] >= limit:
+                    continue
+
+                codes = self.members[priority][group]
+                code = codes.popleft()
+                queue = self.items[(priority, group, code)]
+                item = queue.popleft()
+                if queue:
+                    codes.append(code)
+                else:
+                    del self.items[(priority, group, code)]
+                if not codes:
+                    groups.remove(group)
+                    del self.members[priority][group]
+
+                self.active[group] += 1
+                self.size -= 1
+                return group, item
+
+        return None
+
+    async def get(self) -> tuple[str, Any]:
+        async with self.changed:
+            while (entry := self._pop()) is None:
+                await self.changed.wait()
+            self.changed.notify_all()
+
+            return entry
+
+    async def task_done(self, group: str) -> None:
+        async with self.changed:
+            self.active[group] -= 1
+            self.unfinished -= 1
+            self.changed.notify_all()
+
+    async def join(self) -> None:
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.unfinished == 0)
@@ -0,0 +1,180 @@
+import asyncio
+import os
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.blobstore import blob_store
+from src.requests import (
+    file_size,
+    range_start,
+    remove_file,
+    replace_file,
+    requested_url,
+    verify_bytes,
+    verify_file,
+    write_stream,
+)
+
+data_dir = os.path.join(os.getcwd(), "data")
+
+
+class LocalStorage:
+    chunk_size = 64 * 1024
+
+    def make_dir(self, path: str) -> None:
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+
+    def remove_dir(self, path: str) -> None:
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+    def partial(self, path: str) -> int:
+        return file_size(path + ".part")
+
+    def discard(self, path: str) -> None:
+        remove_file(path + ".part")
+
+    async def upload(self, res: httpx.Response, path: str, expected: int | None) -> int:
+        # a 206 continues the .part file left by an earlier attempt
+        tmp_path = path + ".part"
+        offset = (range_start(res) or 0) if res.status_code == 206 else 0
+        size, digest = await write_stream(res, tmp_path, self.chunk_size, offset)
+        await asyncio.to_thread(verify_file, tmp_path, size, expected)
+        finalize = blob_store.store if blob_store.enabled else replace_file
+        await asyncio.to_thread(finalize, tmp_path, path, requested_url(res), digest)
+        return size
+
+
+class S3Storage:
+    # S3 rejects parts below 5 MiB except for the last one
+    part_size = 8 * 1024 * 1024
+
+    def __init__(self, url: str, endpoint: str | None, concurrency: int) -> None:
+        try:
+            import boto3
+        except ImportError:
+            raise ValueError("the s3 storage requires the boto3 package")
+
+        split = urlsplit(url)
+        self.bucket = split.netloc
+        self.prefix = split.path.strip("/")
+        self.concurrency = max(1, concurrency)
+        self.client = boto3.client("s3", endpoint_url=endpoint)
+
+    def key(self, path: str) -> str:
+        name = os.path.relpath(path, data_dir).replace(os.sep, "/")
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def make_dir(self, path: str) -> None:
+        pass
+
+    def remove_dir(self, path: str) -> None:
+        pass
+
+    # bodies are never half stored, so there is nothing to resume
+    def partial(self, path: str) -> int:
+        return 0
+
+    def discard(self, path: str) -> None:
+        pass
+
+    async def upload(self, res: httpx.Response, path: str, expected: int | None) -> int:
+        # the body goes straight from the response into the bucket; bodies
+        # larger than a part become a multipart upload with `concurrency`
+        # parts in flight, so at most that many parts are held in memory
+        key = self.key(path)
+        content_type = res.headers.get("Content-Type", "application/octet-stream")
+        slots = asyncio.Semaphore(self.concurrency)
+        parts: list[asyncio.Task] = []
+        upload_id: str | None = None
+        buffer = bytearray()
+        head, tail, size = b"", b"", 0
+
+        async def send_part(number: int, body: bytes) -> dict:
+            try:
+                part = await asyncio.to_thread(
+                    self.client.upload_part,
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body,
+                )
+                return {"PartNumber": number, "ETag": part["ETag"]}
+            finally:
+                slots.release()
+
+        async def put_part() -> None:
+            nonlocal upload_id
+            if upload_id is None:
+                created = await asyncio.to_thread(
+                    self.client.create_multipart_upload,
+                    Bucket=self.bucket,
+                    Key=key,
+                    ContentType=content_type,
+                )
+                upload_id = created["UploadId"]
+            await slots.acquire()
+            parts.append(asyncio.create_task(send_part(len(parts) + 1, bytes(buffer))))
+            buffer.clear()
+
+        try:
+            async for chunk in res.aiter_bytes():
+                if len(head) < 8:
+                    head = (head + chunk)[:8]
+                tail = (tail + chunk[-32:])[-32:]
+                size += len(chunk)
+                buffer += chunk
+                if len(buffer) >= self.part_size:
+                    await put_part()
+
+            verify_bytes(head, tail, size, expected)
+            if upload_id is None:
+                await asyncio.to_thread(
+                    self.client.put_object,
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=bytes(buffer),
+                    ContentType=content_type,
+                )
+                return size
+
+            if buffer:
+                await put_part()
+            done = await asyncio.gather(*parts)
+            await asyncio.to_thread(
+                self.client.complete_multipart_upload,
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": done},
+            )
+            return size
+
+        except BaseException:
+            for task in parts:
+                task.cancel()
+            await asyncio.gather(*parts, return_exceptions=True)
+            if upload_id is not None:
+                await asyncio.to_thread(
+                    self.client.abort_multipart_upload,
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                )
+            raise
+
+
+def open_storage(
+    url: str | None, endpoint: str | None = None, concurrency: int = 4
+) -> LocalStorage | S3Storage:
+    if url is None or url == "local":
+        return LocalStorage()
+    if url.startswith("s3://"):
+        return S3Storage(url, endpoint, concurrency)
+
+    raise ValueError(f"unknown storage : {url}")
@@ -0,0 +1,82 @@
+from importlib.util import find_spec
+
+import httpx
+
+from src.ratelimit import group_hosts
+
+
+def http2_available() -> bool:
+    return find_spec("h2") is not None
+
+
+class Transport:
+    def __init__(self) -> None:
+        self.http2 = False
+        self.max_connections = 100
+        self.host_connections: dict[str, int] = {}
+        self.keepalive = 20
+        self.keepalive_expiry = 5.0
+        self.connect_timeout = 5.0
+        self.read_timeout = 5.0
+
+    def configure(
+        self,
+        http2: bool,
+        max_connections: int,
+        host_connections: dict[str, int],
+        keepalive: int,
+        keepalive_expiry: float,
+        connect_timeout: float,
+        read_timeout: float,
+    ) -> None:
+        self.http2 = http2 and http2_available()
+        self.max_connections = max_connections
+        self.host_connections = host_connections
+        self.keepalive = keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def limits(self, max_connections: int) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(self.keepalive, max_connections),
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        # waiting for a free connection is bounded by the rate limiter and the
+        # download queue, so only the network phases time out
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout, pool=None)
+
+    def client_options(self) -> dict:
+        mounts = {
+            f"all://*{suffix}": httpx.AsyncHTTPTransport(
+                http2=self.http2,
+                limits=self.limits(
+                    self.host_connections.get(group, self.max_connections)
+                ),
+            )
+            for group, suffix in group_hosts.items()
+        }
+
+        return {
+            "http2": self.http2,
+            "limits": self.limits(self.max_connections),
+            "timeout": self.timeout(),
+            "mounts": mounts,
+        }
+
+
+def parse_connections(values: list[str] | None) -> dict[str, int]:
+    connections: dict[str, int] = {}
+    for value in values or []:
+        group, _, count = value.partition("=")
+        if group not in group_hosts or count == "":
+            raise ValueError(f"invalid connections : {value}")
+        connections[group] = int(count)
+
+    return connections
+
+
+transport = Transport()
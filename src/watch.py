@@ -0,0 +1,93 @@
+import asyncio
+from contextlib import nullcontext
+from datetime import datetime
+
+import httpx
+
+from src import planner
+from src.recorder import Recorder
+from src.roster import attach_dates, roster_cache
+
+recorder = Recorder()
+
+# share of a member's usual gap between posts to wait before the next poll;
+# a member who posts daily is polled about every 7 minutes
+poll_fraction = 0.005
+
+
+def poll_interval(
+    dates: list[datetime],
+    now: datetime,
+    min_interval: float,
+    max_interval: float,
+    fraction: float = poll_fraction,
+) -> float:
+    if not dates:
+        return max_interval
+
+    gaps = sorted((a - b).total_seconds() for a, b in zip(dates, dates[1:]))
+    typical = gaps[len(gaps) // 2] if gaps else max_interval
+    # a member who stopped posting slows down however busy they used to be
+    gap = max(typical, (now - dates[0]).total_seconds())
+
+    return min(max(gap * fraction, min_interval), max_interval)
+
+
+class Watcher:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        crawler,
+        min_interval: float,
+        max_interval: float,
+        limit: int | None = None,
+        fraction: float = poll_fraction,
+    ) -> None:
+        self.client = client
+        self.crawler = crawler
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.fraction = fraction
+        self.semaphore = asyncio.Semaphore(limit) if limit else nullcontext()
+        self.tasks: dict[tuple[str, str], asyncio.Task] = {}
+
+    async def run(self, args) -> None:
+        try:
+            while True:
+                planned = await planner.plan(self.client, args)
+                keys = {(group, info["code"]) for group, info in planned}
+                for group, info in planned:
+                    if (group, info["code"]) not in self.tasks:
+                        task = asyncio.create_task(self.watch_member(group, info))
+                        self.tasks[(group, info["code"])] = task
+                for key in set(self.tasks) - keys:
+                    self.tasks.pop(key).cancel()
+
+                # rosters are only fetched again once the roster cache expired
+                await asyncio.sleep(max(roster_cache.ttl, self.min_interval))
+        finally:
+            for task in self.tasks.values():
+                task.cancel()
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    async def watch_member(self, group: str, info: dict) -> None:
+        while True:
+            async with self.semaphore:
+                (info,) = attach_dates(group, [info])
+                collector = planner.modules[group].Collector(
+                    client=self.client, crawler=self.crawler, **info
+                )
+                try:
+                    await collector.run()
+                except Exception as e:
+                    collector.logger.error({"message": "poll failed", "Exception": e})
+
+            interval = poll_interval(
+                recorder.article_dates(group, info["code"]),
+                datetime.now(),
+                self.min_interval,
+                self.max_interval,
+                self.fraction,
+            )
+            collector.logger.info({"message": "next poll", "seconds": round(interval)})
+            await asyncio.sleep(interval)
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+
+from src.httpcache import cache_dir
+from src.recorder import busy_timeout
+
+default_store = "sqlite:" + os.path.join(cache_dir, "work.db")
+
+schema = """
+CREATE TABLE IF NOT EXISTS claims (
+    run TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    code TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    claimed REAL NOT NULL,
+    expires REAL NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run, grp, code)
+);
+"""
+
+
+def owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# a claim lapses unless its owner renews it, so the members of a shard that
+# died are crawled by whoever runs the same run id next
+class SQLiteWorkStore:
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=busy_timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(schema)
+        columns = [r[1] for r in self.conn.execute("PRAGMA table_info(claims)")]
+        if "expires" not in columns:
+            with self.conn:
+                self.conn.execute(
+                    "ALTER TABLE claims ADD COLUMN expires REAL NOT NULL DEFAULT 0"
+                )
+                self.conn.execute(
+                    "ALTER TABLE claims ADD COLUMN done INTEGER NOT NULL DEFAULT 0"
+                )
+
+    def claim(self, run: str, group: str, code: str, owner: str, lease: float) -> bool:
+        now = time.time()
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO claims VALUES (?, ?, ?, ?, ?, ?, 0)"
+                " ON CONFLICT (run, grp, code) DO UPDATE SET owner = excluded.owner,"
+                " claimed = excluded.claimed, expires = excluded.expires"
+                " WHERE claims.done = 0 AND claims.expires < excluded.claimed",
+                (run, group, code, owner, now, now + lease),
+            )
+
+        return cur.rowcount == 1
+
+    def renew(self, run: str, group: str, code: str, owner: str, lease: float) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE claims SET expires = ?"
+                " WHERE run = ? AND grp = ? AND code = ? AND owner = ? AND done = 0",
+                (time.time() + lease, run, group, code, owner),
+            )
+
+    def finish(self, run: str, group: str, code: str, owner: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE claims SET done = 1"
+                " WHERE run = ? AND grp = ? AND code = ? AND owner = ?",
+                (run, group, code, owner),
+            )
+
+    def release(self, run: str, group: str, code: str, owner: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM claims"
+                " WHERE run = ? AND grp = ? AND code = ? AND owner = ? AND done = 0",
+                (run, group, code, owner),
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class RedisWorkStore:
+    # a finished member only has to stay claimed for as long as its run lasts
+    done_ttl = 7 * 24 * 60 * 60
+
+    def __init__(self, url: str) -> None:
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("the redis work store requires the redis package")
+
+        self.client = redis.Redis.from_url(url)
+
+    def key(self, run: str, group: str, code: str) -> str:
+        return f"sakamichi-blog-crawler:{run}:{group}:{code}"
+
+    def claim(self, run: str, group: str, code: str, owner: str, lease: float) -> bool:
+        key = self.key(run, group, code)
+        return bool(self.client.set(key, owner, nx=True, px=int(lease * 1000)))
+
+    def _owned(self, key: str, owner: str) -> bool:
+        return self.client.get(key) == owner.encode()
+
+    def renew(self, run: str, group: str, code: str, owner: str, lease: float) -> None:
+        key = self.key(run, group, code)
+        if self._owned(key, owner):
+            self.client.set(key, owner, xx=True, px=int(lease * 1000))
+
+    def finish(self, run: str, group: str, code: str, owner: str) -> None:
+        key = self.key(run, group, code)
+        if self._owned(key, owner):
+            self.client.set(key, "done:" + owner, xx=True, ex=self.done_ttl)
+
+    def release(self, run: str, group: str, code: str, owner: str) -> None:
+        key = self.key(run, group, code)
+        if self._owned(key, owner):
+            self.client.delete(key)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+@asynccontextmanager
+async def holding(store, claim: tuple[str, str, str, str], lease: float):
+    # renewed well before it lapses; a member that failed is released so the
+    # next run with this id does not have to wait for the lease
+    async def renew() -> None:
+        while True:
+            await asyncio.sleep(lease / 3)
+            store.renew(*claim, lease)
+
+    renewing = asyncio.create_task(renew())
+    try:
+        yield
+    except BaseException:
+        store.release(*claim)
+        raise
+    finally:
+        renewing.cancel()
+    store.finish(*claim)
+
+
+def open_store(url: str) -> SQLiteWorkStore | RedisWorkStore:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisWorkStore(url)
+    if url.startswith("sqlite:"):
+        return SQLiteWorkStore(url.removeprefix("sqlite:"))
+
+    raise ValueError(f"unknown work store : {url}")